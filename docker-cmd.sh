@@ -1,7 +1,9 @@
 #!/usr/bin/env bash
 
+export HOST=0.0.0.0
+
 if [[ $TELEMETRY_DISABLED ]]; then
-  uvicorn --log-config=winds_mobi_api/logging.yaml --proxy-headers --root-path="$ROOT_PATH" --host=0.0.0.0 --port="$PORT" winds_mobi_api.main:app
+  python -m winds_mobi_api
 else
-  opentelemetry-instrument --service_name=winds-mobi-api --metrics_exporter=none uvicorn --log-config=winds_mobi_api/logging.yaml --proxy-headers --root-path="$ROOT_PATH" --host=0.0.0.0 --port="$PORT" winds_mobi_api.main:app
+  opentelemetry-instrument --service_name=winds-mobi-api --metrics_exporter=none python -m winds_mobi_api
 fi
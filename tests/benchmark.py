@@ -0,0 +1,291 @@
+"""
+Offline benchmarks: seeds a mongodb database with synthetic stations and measures, then runs microbenchmarks and
+end-to-end requests through the ASGI app. Results are written as JSON and can be compared to a previous run.
+
+MONGODB_URL=mongodb://localhost:27017/winds_benchmark ROOT_PATH= python -m tests.benchmark --output benchmark.json
+MONGODB_URL=mongodb://localhost:27017/winds_benchmark ROOT_PATH= python -m tests.benchmark --compare benchmark.json
+
+The database name must contain "benchmark": it is dropped before being seeded. With `--stand-in`, the database is
+an in-process mongomock-motor database (installed with the dev dependencies): the endpoints using geo queries or the
+trigonometric aggregation operators are then reported with errors.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+
+os.environ.setdefault("ROOT_PATH", "")
+
+providers = ["holfuy", "meteoswiss", "windline", "pioupiou", "ffvl"]
+words = ["Mont", "Col", "Dôle", "Chasseral", "Crêt", "Léman", "Gruyère", "Säntis", "Zürich", "Aiguille", "Pointe"]
+bounds = {"lon": (5.0, 11.0), "lat": (45.0, 48.0)}
+
+
+def generate_station(rng, index, now):
+    provider = providers[index % len(providers)]
+    last_time = now - rng.randint(0, 3600)
+    return {
+        "_id": f"{provider}-{index}",
+        "pv-id": str(index),
+        "pv-code": provider,
+        "pv-name": f"{provider}.com",
+        "short": f"{rng.choice(words)} {index}",
+        "name": f"{rng.choice(words)} {rng.choice(words)} {index}",
+        "alt": rng.randint(300, 4000),
+        "peak": rng.random() < 0.3,
+        "status": rng.choices(["green", "orange", "red", "hidden"], [80, 10, 8, 2])[0],
+        "tz": "Europe/Zurich",
+        "loc": {"type": "Point", "coordinates": [rng.uniform(*bounds["lon"]), rng.uniform(*bounds["lat"])]},
+        "clusters": sorted(rng.sample(range(1, 101), 3)),
+        "last": generate_measure(rng, last_time),
+        "duplicates": {"is_highest_rating": rng.random() < 0.9},
+        "url": {"default": f"https://{provider}.com/{index}"},
+    }
+
+
+def generate_measure(rng, measure_time):
+    w_avg = rng.uniform(0, 50)
+    return {
+        "_id": measure_time,
+        "w-dir": rng.randint(0, 359),
+        "w-avg": w_avg,
+        "w-max": w_avg + rng.uniform(0, 30),
+        "temp": rng.uniform(-15, 30),
+        "hum": rng.uniform(10, 100),
+        "rain": rng.uniform(0, 5),
+        "pres": {"qfe": rng.uniform(850, 1000), "qnh": rng.uniform(990, 1030), "qff": rng.uniform(990, 1030)},
+    }
+
+
+async def seed(mongodb, nb_stations, nb_measures, random_seed, geo_index=True):
+    rng = random.Random(random_seed)
+    now = int(time.time())
+    await mongodb.client.drop_database(mongodb.name)
+    stations = [generate_station(rng, index, now) for index in range(nb_stations)]
+    await mongodb.stations.insert_many(stations)
+    if geo_index:
+        await mongodb.stations.create_index([("loc", "2dsphere")])
+    await mongodb.stations_clusters.insert_one({"_id": "save_clusters", "min": 1, "max": 100})
+    for station in stations:
+        last_time = station["last"]["_id"]
+        measures = [station["last"]]
+        measures += [generate_measure(rng, last_time - index * 600) for index in range(1, nb_measures)]
+        await mongodb[station["_id"]].insert_many(measures)
+    return [station["_id"] for station in stations]
+
+
+def microbenchmark(func, number):
+    # Best of 5 runs to remove the noise of the other processes
+    return min(timeit.repeat(func, repeat=5, number=number)) / number * 1e6
+
+
+def run_microbenchmarks(number):
+    import orjson
+
+    from winds_mobi_api import diacritics
+    from winds_mobi_api.models import StationKey, station_key_defaults
+    from winds_mobi_api.mongo_utils import generate_box_geometry, project
+
+    rng = random.Random(0)
+    now = int(time.time())
+    stations = [generate_station(rng, index, now) for index in range(500)]
+    names = [station["name"] for station in stations]
+    keys = [StationKey(key) for key in station_key_defaults]
+
+    def build_projection():
+        projection_dict = {}
+        for key in keys:
+            projection_dict[key.value] = 1
+        projection_dict["last._id"] = 1
+        return projection_dict
+
+    projection_dict = build_projection()
+    benchmarks = {
+        "diacritics.normalize (500 names)": lambda: [diacritics.normalize(name) for name in names],
+        "diacritics.create_regexp": lambda: diacritics.create_regexp("Gruyère Dôle"),
+        "generate_box_geometry (small box)": lambda: generate_box_geometry([6.5, 46.0], [7.5, 46.8]),
+        "generate_box_geometry (world)": lambda: generate_box_geometry([-180, -85], [180, 85]),
+        "projection building": build_projection,
+        "project (500 stations)": lambda: [project(station, projection_dict) for station in stations],
+        "orjson.dumps (500 stations)": lambda: orjson.dumps(stations),
+    }
+    return {name: {"mean_us": round(microbenchmark(func, number), 3)} for name, func in benchmarks.items()}
+
+
+def endpoints(station_ids):
+    def box(rng):
+        lon, lat = rng.uniform(*bounds["lon"]), rng.uniform(*bounds["lat"])
+        return f"within-pt1-lat={lat + 1}&within-pt1-lon={lon + 1.5}&within-pt2-lat={lat}&within-pt2-lon={lon}"
+
+    def ids(rng, count):
+        return "&".join(f"ids={station_id}" for station_id in rng.sample(station_ids, count))
+
+    return {
+        "get_station": lambda rng: f"/stations/{rng.choice(station_ids)}/",
+        "get_station_historic": lambda rng: f"/stations/{rng.choice(station_ids)}/historic/?duration=86400",
+        "get_station_historic (points)": lambda rng: f"/stations/{rng.choice(station_ids)}/historic/"
+        "?duration=604800&points=100",
+        "get_station_stats": lambda rng: f"/stations/{rng.choice(station_ids)}/stats/?duration=604800",
+        "find_stations (ids)": lambda rng: f"/stations/?{ids(rng, 20)}",
+        "find_stations (provider)": lambda rng: f"/stations/?provider={rng.choice(providers)}",
+        "find_stations (search)": lambda rng: f"/stations/?search={rng.choice(words)}",
+        "find_stations (near)": lambda rng: f"/stations/?limit=12&near-lat={rng.uniform(*bounds['lat'])}"
+        f"&near-lon={rng.uniform(*bounds['lon'])}",
+        "find_stations (within)": lambda rng: f"/stations/?limit=248&{box(rng)}",
+        "find_stations (within, columnar)": lambda rng: f"/stations/?limit=248&format=columnar&{box(rng)}",
+        "find_stations_historic": lambda rng: f"/stations/historic/?{ids(rng, 10)}&duration=3600",
+        "find_station_clusters": lambda rng: f"/stations/clusters/?zoom=9&{box(rng)}",
+        "get_tile": lambda rng: f"/stations/tiles/8/{rng.randint(131, 135)}/{rng.randint(89, 92)}/",
+    }
+
+
+async def run_endpoint(client, urls, concurrency):
+    # The non-2xx responses are counted apart: they are left out of the latencies and throughput
+    latencies = []
+    errors = 0
+    for url in urls:
+        start = time.perf_counter()
+        response = await client.get(url)
+        if response.is_success:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+
+    remaining_urls = iter(urls)
+    successes = 0
+
+    async def worker():
+        nonlocal successes
+        for url in remaining_urls:
+            response = await client.get(url)
+            successes += response.is_success
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    if len(latencies) < 2:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "rps": None, "errors": errors}
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(quantiles[94], 3),
+        "p99_ms": round(quantiles[98], 3),
+        "rps": round(successes / elapsed, 1),
+        "errors": errors,
+    }
+
+
+async def run_endpoints(station_ids, nb_requests, concurrency, random_seed):
+    import httpx
+
+    from winds_mobi_api.main import app, lifespan
+
+    results = {}
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name, endpoint in endpoints(station_ids).items():
+                rng = random.Random(random_seed)
+                urls = [endpoint(rng) for _ in range(nb_requests)]
+                # Warm up
+                await client.get(urls[0])
+                results[name] = await run_endpoint(client, urls, concurrency)
+                print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of the results compared to the baseline.
+    """
+    regressions = []
+    for name, result in results["micro"].items():
+        previous = baseline.get("micro", {}).get(name)
+        if previous and result["mean_us"] > previous["mean_us"] * (1 + tolerance):
+            regressions.append(f"{name}: mean {previous['mean_us']}us -> {result['mean_us']}us")
+    for name, result in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        if result["errors"] > previous.get("errors", 0):
+            regressions.append(f"{name}: {previous.get('errors', 0)} -> {result['errors']} non-2xx responses")
+        if result["p50_ms"] is None or previous["p50_ms"] is None:
+            continue
+        if result["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50_ms']}ms -> {result['p50_ms']}ms")
+        if result["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {result['rps']} requests/s")
+    return regressions
+
+
+async def main(args):
+    if args.stand_in:
+        from mongomock_motor import AsyncMongoMockClient
+
+        os.environ.setdefault("MONGODB_URL", "mongodb://localhost/winds_benchmark")
+        os.environ["STATIONS_SNAPSHOT_CHANGE_STREAM"] = "false"
+
+    from winds_mobi_api import database
+    from winds_mobi_api.settings import settings
+
+    if args.stand_in:
+        database.motor_database = AsyncMongoMockClient().get_database("winds_benchmark")
+    mongodb = database.mongodb()
+    if "benchmark" not in mongodb.name:
+        raise SystemExit(f"The database name must contain 'benchmark' to be dropped: '{mongodb.name}'")
+
+    print(f"Seeding {args.stations} stations with {args.measures} measures", file=sys.stderr)
+    station_ids = await seed(mongodb, args.stations, args.measures, args.seed, geo_index=not args.stand_in)
+
+    results = {
+        "meta": {
+            "time": int(time.time()),
+            "python": platform.python_version(),
+            "stand_in": args.stand_in,
+            "stations": args.stations,
+            "measures": args.measures,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "settings": {
+                name: getattr(settings, name)
+                for name in ["stations_snapshot", "stations_index", "search_index", "coalescing"]
+            },
+        },
+        "micro": run_microbenchmarks(args.number),
+        "endpoints": await run_endpoints(station_ids, args.requests, args.concurrency, args.seed),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=2000, help="Number of stations")
+    parser.add_argument("--measures", type=int, default=500, help="Number of measures per station")
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent requests for the throughput")
+    parser.add_argument("--number", type=int, default=200, help="Number of calls per microbenchmark run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the dataset and requests")
+    parser.add_argument("--stand-in", action="store_true", help="Use an in-process mongomock-motor database")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results to this JSON file, exit with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Tolerated relative slowdown")
+    asyncio.run(main(parser.parse_args()))
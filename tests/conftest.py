@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import mongomock.filtering
+import pytest
+
+# Required settings, the tests don't connect to mongodb
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017/winds_test")
+os.environ.setdefault("ROOT_PATH", "")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from winds_mobi_api import cache, database  # noqa: E402
+from winds_mobi_api.coalescing import response_coalescer  # noqa: E402
+from winds_mobi_api.search import search_index  # noqa: E402
+from winds_mobi_api.snapshot import stations_snapshot  # noqa: E402
+from winds_mobi_api.stations_index import stations_index  # noqa: E402
+
+
+class Clock:
+    """
+    Replaces time.time or time.monotonic, the tests move it forward.
+    """
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock(1000)
+
+
+def geo_within(value, operand):
+    # Bounding box of the polygon: enough for the boxes of `generate_box_geometry`
+    if not isinstance(value, dict):
+        return False
+    lon, lat = value["coordinates"][:2]
+    points = operand["$geometry"]["coordinates"][0]
+    return min(point[0] for point in points) <= lon <= max(point[0] for point in points) and min(
+        point[1] for point in points
+    ) <= lat <= max(point[1] for point in points)
+
+
+@pytest.fixture
+def mongodb(monkeypatch):
+    # In-process stand-in: no $near queries, trigonometric aggregation operators or change streams
+    monkeypatch.setattr(
+        mongomock.filtering,
+        "_NOT_IMPLEMENTED_OPERATORS",
+        mongomock.filtering._NOT_IMPLEMENTED_OPERATORS - {"$geoWithin"},
+    )
+    monkeypatch.setitem(mongomock.filtering._filterer_inst._operator_map, "$geoWithin", geo_within)
+    return AsyncMongoMockClient().get_database("winds_test")
+
+
+@pytest.fixture
+def insert(mongodb):
+    def insert(collection, documents):
+        asyncio.run(mongodb[collection].insert_many(documents))
+
+    return insert
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    # The in-memory state of the workers is shared by the tests
+    monkeypatch.setattr(stations_snapshot, "stations", {})
+    monkeypatch.setattr(stations_snapshot, "providers", {})
+    monkeypatch.setattr(stations_snapshot, "loaded", asyncio.Event())
+    monkeypatch.setattr(stations_snapshot, "listeners", [])
+    monkeypatch.setattr(stations_index, "ready", False)
+    monkeypatch.setattr(search_index, "ready", False)
+    monkeypatch.setattr(cache, "cache", cache.Cache(cache.MemoryBackend(1000)))
+    monkeypatch.setattr(response_coalescer, "cache", {})
+    monkeypatch.setattr(response_coalescer, "flights", {})
+
+
+@pytest.fixture
+def client(mongodb):
+    from winds_mobi_api.main import app
+
+    app.dependency_overrides[database.mongodb] = lambda: mongodb
+    # The lifespan (warmup and background tasks) is not run
+    yield TestClient(app)
+    app.dependency_overrides.clear()
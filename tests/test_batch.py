@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+now = int(time.time())
+
+
+@pytest.fixture
+def stations(insert):
+    insert(
+        "stations",
+        [
+            {
+                "_id": f"{provider}-{i}",
+                "pv-code": provider,
+                "short": f"short {i}",
+                "name": f"name {i}",
+                "alt": i,
+                "status": "green",
+                "last": {"_id": now},
+            }
+            for provider in ["holfuy", "windline"]
+            for i in range(3)
+        ],
+    )
+
+
+def test_batch(client, stations):
+    queries = [
+        {"provider": "windline", "keys": ["short"]},
+        {"ids": ["holfuy-2", "holfuy-0"], "keys": ["name"]},
+        # Same search with other keys
+        {"provider": "windline", "keys": ["alt"]},
+        {"ids": ["holfuy-3"]},
+    ]
+    response = client.post("/stations/batch/", json=queries)
+    assert response.status_code == 200
+    windline, holfuy, windline_alt, missing = response.json()
+    assert sorted(windline, key=lambda station: station["_id"]) == [
+        {"_id": f"windline-{i}", "short": f"short {i}", "last": {"_id": now}} for i in range(3)
+    ]
+    assert holfuy == [
+        {"_id": "holfuy-2", "name": "name 2", "last": {"_id": now}},
+        {"_id": "holfuy-0", "name": "name 0", "last": {"_id": now}},
+    ]
+    assert sorted(station["alt"] for station in windline_alt) == [0, 1, 2]
+    assert missing == []
+
+
+@pytest.mark.parametrize("nb_queries", [0, 21])
+def test_batch_errors(client, nb_queries):
+    response = client.post("/stations/batch/", json=[{"provider": "holfuy"}] * nb_queries)
+    assert response.status_code == 400
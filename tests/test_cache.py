@@ -0,0 +1,121 @@
+import asyncio
+
+from fakeredis import aioredis
+
+from winds_mobi_api import cache
+from winds_mobi_api.cache import Cache, MemoryBackend, RedisBackend
+
+
+class Fetch:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.calls
+
+
+def redis_backend(**kwargs):
+    # fakeredis stands in for a redis server
+    backend = RedisBackend("redis://localhost:6379/0")
+    backend.redis = aioredis.FakeRedis(**kwargs)
+    return backend
+
+
+def test_redis_backend():
+    async def run():
+        backend = redis_backend()
+        assert await backend.get("key") is None
+        await backend.set("key", [{"_id": "station", "w-avg": 12.5}, 1700000000.0], 60)
+        assert await backend.get("key") == [{"_id": "station", "w-avg": 12.5}, 1700000000.0]
+        assert 0 < await backend.redis.pttl("key") <= 60000
+        await backend.delete("key")
+        assert await backend.get("key") is None
+
+    asyncio.run(run())
+
+
+def test_redis_backend_errors():
+    async def run():
+        backend = redis_backend(connected=False)
+        await backend.set("key", "value", 60)
+        assert await backend.get("key") is None
+        await backend.delete("key")
+
+    asyncio.run(run())
+
+
+def test_memory_backend(monkeypatch, clock):
+    monkeypatch.setattr(cache.time, "time", clock)
+
+    async def run():
+        backend = MemoryBackend(2)
+        await backend.set("a", 1, 10)
+        await backend.set("b", 2, 10)
+        assert await backend.get("a") == 1
+        # Least recently used
+        await backend.set("c", 3, 10)
+        assert await backend.get("b") is None
+        assert await backend.get("a") == 1
+        clock.now += 10
+        assert await backend.get("a") is None
+
+    asyncio.run(run())
+
+
+def test_cache_get(monkeypatch, clock):
+    monkeypatch.setattr(cache.time, "time", clock)
+
+    async def run():
+        fetch = Fetch()
+        values = Cache(MemoryBackend(10))
+        # Concurrent loads of a key are coalesced
+        assert await asyncio.gather(values.get("key", fetch, 10), values.get("key", fetch, 10)) == [1, 1]
+        clock.now += 9
+        assert await values.get("key", fetch, 10) == 1
+        assert fetch.calls == 1
+        # Expired without stale_ttl
+        clock.now += 1
+        assert await values.get("key", fetch, 10) == 2
+
+    asyncio.run(run())
+
+
+def test_cache_get_stale(monkeypatch, clock):
+    monkeypatch.setattr(cache.time, "time", clock)
+
+    async def run():
+        fetch = Fetch()
+        values = Cache(MemoryBackend(10))
+        assert await values.get("key", fetch, 10, stale_ttl=20) == 1
+        # Served stale while it is refreshed in the background
+        clock.now += 15
+        assert await values.get("key", fetch, 10, stale_ttl=20) == 1
+        await values.loads["key"]
+        assert await values.get("key", fetch, 10, stale_ttl=20) == 2
+        # Not served after stale_ttl
+        clock.now += 30
+        assert await values.get("key", fetch, 10, stale_ttl=20) == 3
+
+    asyncio.run(run())
+
+
+def test_cache_get_refresh_ahead(monkeypatch, clock):
+    monkeypatch.setattr(cache.time, "time", clock)
+
+    async def run():
+        fetch = Fetch()
+        values = Cache(MemoryBackend(10))
+        assert await values.get("key", fetch, 10, refresh_ahead=0.8) == 1
+        clock.now += 7
+        assert await values.get("key", fetch, 10, refresh_ahead=0.8) == 1
+        assert not values.loads
+        # Fresh but refreshed in the background
+        clock.now += 1
+        assert await values.get("key", fetch, 10, refresh_ahead=0.8) == 1
+        await values.loads["key"]
+        assert await values.get("key", fetch, 10, refresh_ahead=0.8) == 2
+        assert fetch.calls == 2
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+import asyncio
+
+from winds_mobi_api.coalescing import CoalescingMiddleware, ResponseCoalescer, get_key
+
+
+def scope(path, query_string=b"", method="GET", headers=None):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "root_path": "",
+        "query_string": query_string,
+        "headers": headers or [],
+    }
+
+
+def test_get_key():
+    key = get_key(scope("/stations/", b"keys=short&keys=last&limit=5&is-peak=true"))
+    assert get_key(scope("/stations/", b"limit=5&keys=last&is-peak=1&keys=short&keys=last")) == key
+    assert get_key(scope("/stations/", b"limit=5&keys=last&is-peak=yes&keys=short")) == key
+    assert get_key(scope("/stations/", b"limit=5&keys=last&is-peak=false&keys=short")) != key
+    assert get_key(scope("/stations/", b"limit=6&keys=last&is-peak=true&keys=short")) != key
+    # The response follows the order of the ids
+    assert get_key(scope("/stations/", b"ids=a&ids=b&ids=a")) == get_key(scope("/stations/", b"ids=a&ids=b"))
+    assert get_key(scope("/stations/", b"ids=a&ids=b")) != get_key(scope("/stations/", b"ids=b&ids=a"))
+    # Request headers that change the response
+    assert get_key(scope("/stations/", headers=[(b"accept-language", b"fr")])) != get_key(scope("/stations/"))
+    assert get_key(scope("/stations/", headers=[(b"user-agent", b"test")])) == get_key(scope("/stations/"))
+
+
+class App:
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await self.release.wait()
+        await send({"type": "http.response.start", "status": self.status, "headers": [(b"x-call", b"%d" % self.calls)]})
+        await send({"type": "http.response.body", "body": b"part 1, ", "more_body": True})
+        await send({"type": "http.response.body", "body": b"part 2"})
+
+
+async def request(middleware, scope):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, None, send)
+    return messages[0]["status"], dict(messages[0]["headers"])[b"x-call"], messages[1]["body"]
+
+
+def test_middleware():
+    async def run():
+        app = App()
+        middleware = CoalescingMiddleware(app, cache_ttl=60)
+        requests = [
+            request(middleware, scope("/stations/", b"keys=short&keys=last")),
+            request(middleware, scope("/stations/", b"keys=last&keys=short")),
+        ]
+        tasks = [asyncio.create_task(coroutine) for coroutine in requests]
+        await asyncio.sleep(0.01)
+        app.release.set()
+        # Single flight
+        assert await asyncio.gather(*tasks) == [(200, b"1", b"part 1, part 2")] * 2
+        assert app.calls == 1
+        # Kept for cache_ttl
+        assert await request(middleware, scope("/stations/", b"keys=short&keys=last")) == (200, b"1", b"part 1, part 2")
+        assert app.calls == 1
+        assert await request(middleware, scope("/stations/holfuy-1/historic/")) == (200, b"2", b"part 1, part 2")
+
+        # Not coalesced
+        for not_coalesced in [
+            scope("/stations/", method="POST"),
+            scope("/stations/live/"),
+            scope("/stations/holfuy-1/historic/", b"format=ndjson"),
+        ]:
+            calls = app.calls
+            await middleware(not_coalesced, None, lambda message: asyncio.sleep(0))
+            await middleware(not_coalesced, None, lambda message: asyncio.sleep(0))
+            assert app.calls == calls + 2
+
+    asyncio.run(run())
+
+
+def test_middleware_errors():
+    async def run():
+        app = App(status=500)
+        app.release.set()
+        middleware = CoalescingMiddleware(app, cache_ttl=60)
+        assert await request(middleware, scope("/stations/")) == (500, b"1", b"part 1, part 2")
+        # Errors are not kept
+        assert await request(middleware, scope("/stations/")) == (500, b"2", b"part 1, part 2")
+
+    asyncio.run(run())
+
+
+def test_prune():
+    coalescer = ResponseCoalescer()
+    coalescer.cache = {"a": (1, None), "b": (2, None), "c": (3, None)}
+    coalescer.prune(2)
+    assert list(coalescer.cache) == ["c"]
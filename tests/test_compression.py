@@ -0,0 +1,78 @@
+import gzip
+import time
+
+from winds_mobi_api import compression
+from winds_mobi_api.compression import CompressedBodies, negotiate
+
+
+def test_negotiate(monkeypatch):
+    monkeypatch.setitem(compression.compressors, "zstd", lambda body: body)
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate("GZIP") == "gzip"
+    assert negotiate("*") == "zstd"
+
+
+def test_negotiate_qualities(monkeypatch):
+    monkeypatch.setitem(compression.compressors, "zstd", lambda body: body)
+    assert negotiate("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate("gzip; q=0.8, br;q=0.9, zstd;q=0.1") == "br"
+    assert negotiate("br;q=0, gzip") == "gzip"
+    assert negotiate("br;q=0, gzip;q=0") is None
+    assert negotiate("*;q=0.5, zstd;q=0") == "br"
+    # Invalid qualities are ignored
+    assert negotiate("br;q=high, gzip") == "gzip"
+
+
+def test_negotiate_without_zstd(monkeypatch):
+    monkeypatch.delitem(compression.compressors, "zstd", raising=False)
+    assert negotiate("zstd") is None
+    assert negotiate("zstd, gzip") == "gzip"
+
+
+def test_compressors():
+    body = b'{"_id": "holfuy-1636"}' * 100
+    assert gzip.decompress(compression.compressors["gzip"](body)) == body
+
+
+def test_compressed_bodies():
+    bodies = CompressedBodies(10)
+    bodies.set("a", b"1234")
+    bodies.set("b", b"1234")
+    assert bodies.get("a") == b"1234"
+    # Least recently used
+    bodies.set("c", b"1234")
+    assert bodies.get("b") is None
+    assert bodies.get("a") == b"1234"
+    assert bodies.size == 8
+    bodies.set("a", b"12")
+    assert bodies.size == 6
+
+
+def test_middleware(client, insert):
+    now = int(time.time())
+    insert("stations", [{"_id": f"holfuy-{i}", "short": "Suchet", "last": {"_id": now}} for i in range(50)])
+    insert("holfuy-1", [{"_id": now - k * 60, "w-avg": k} for k in range(50)])
+
+    response = client.get("/stations/", params={"keys": ["short"], "limit": 50}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) == 50
+
+    response = client.get(
+        "/stations/", params={"keys": ["short"], "limit": 50}, headers={"Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 50
+    # Too small
+    response = client.get("/stations/holfuy-1/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    # Streamed
+    params = {"duration": 7200, "format": "ndjson"}
+    response = client.get("/stations/holfuy-1/historic/", params=params, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert len(response.content.splitlines()) == 50
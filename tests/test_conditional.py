@@ -0,0 +1,42 @@
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+from winds_mobi_api.coalescing import response_coalescer
+
+last_time = 1_700_000_000
+
+
+@pytest.fixture
+def station(insert):
+    insert("stations", [{"_id": "holfuy-1", "short": "Suchet", "last": {"_id": last_time}}])
+    insert("holfuy-1", [{"_id": last_time, "w-avg": 10}])
+
+
+@pytest.mark.parametrize("path", ["/stations/holfuy-1/", "/stations/holfuy-1/historic/"])
+def test_not_modified(client, mongodb, station, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert response.headers["last-modified"] == formatdate(last_time, usegmt=True)
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get(path, headers={"If-None-Match": f'"other", {etag.removeprefix("W/")}'}).status_code == 304
+    assert client.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get(path, headers={"If-Modified-Since": formatdate(last_time, usegmt=True)}).status_code == 304
+    assert client.get(path, headers={"If-Modified-Since": formatdate(last_time - 1, usegmt=True)}).status_code == 200
+    assert client.get(path, headers={"If-Modified-Since": "yesterday"}).status_code == 200
+    # The parameters are part of the ETag
+    assert client.get(path, params={"format": "json"}, headers={"If-None-Match": etag}).status_code == 200
+
+    # New measure
+    asyncio.run(mongodb.stations.update_one({"_id": "holfuy-1"}, {"$set": {"last._id": last_time + 60}}))
+    response_coalescer.cache.clear()
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
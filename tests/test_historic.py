@@ -0,0 +1,229 @@
+import asyncio
+
+import msgpack
+import orjson
+import pytest
+
+from winds_mobi_api.historic import (
+    aggregate_paths,
+    aggregate_pipeline,
+    group_stage,
+    project_stage,
+    rollup_aggregate_pipeline,
+    rollup_pipeline,
+)
+from winds_mobi_api.models import MeasureKey
+
+# Multiple of all the buckets of the tests
+last_time = 1_700_002_800
+
+
+@pytest.fixture
+def measures(insert):
+    insert("stations", [{"_id": "holfuy-1", "last": {"_id": last_time}}])
+    insert(
+        "holfuy-1",
+        [
+            {"_id": last_time - k * 60, "w-avg": k, "w-max": k + 10, "pres": {"qfe": 1000 + k, "qnh": 1013}}
+            for k in range(120)
+        ],
+    )
+
+
+def test_pipeline(mongodb, measures):
+    keys = [MeasureKey.id, MeasureKey.w_avg, MeasureKey.pres]
+    pipeline = aggregate_pipeline({"_id": {"$gte": last_time - 3600}}, 600, keys)
+    aggregates = asyncio.run(mongodb["holfuy-1"].aggregate(pipeline).to_list(None))
+    assert [aggregate["_id"] for aggregate in aggregates] == [last_time - i * 600 for i in range(7)]
+    assert aggregates[1] == {
+        "_id": last_time - 600,
+        "w-avg": {"min": 1, "max": 10, "avg": 5.5},
+        "pres": {"qfe": 1005.5, "qnh": 1013, "qff": None},
+    }
+
+
+def test_wind_direction_stages():
+    # Circular mean of the directions: not supported by mongomock
+    group = group_stage(600, [MeasureKey.w_dir])["$group"]
+    assert group["w-dir-sin"] == {"$avg": {"$sin": {"$degreesToRadians": "$w-dir"}}}
+    assert group["w-dir-cos"] == {"$avg": {"$cos": {"$degreesToRadians": "$w-dir"}}}
+    project = project_stage([MeasureKey.w_dir])["$project"]
+    assert project["w-dir"]["$mod"][1] == 360
+    assert project_stage([MeasureKey.id]) == {"$project": {"_id": 1}}
+
+
+def test_aggregate_paths():
+    assert aggregate_paths([MeasureKey.id, MeasureKey.w_dir, MeasureKey.w_avg, MeasureKey.pres]) == [
+        "_id",
+        "w-dir",
+        "w-avg.min",
+        "w-avg.max",
+        "w-avg.avg",
+        "pres.qfe",
+        "pres.qnh",
+        "pres.qff",
+    ]
+
+
+def test_bucket(client, measures):
+    params = {"duration": 3600, "keys": ["w-avg", "w-max"]}
+    response = client.get("/stations/holfuy-1/historic/", params={**params, "bucket": 600})
+    assert response.status_code == 200
+    aggregates = response.json()
+    assert len(aggregates) == 7
+    assert aggregates[1] == {
+        "_id": last_time - 600,
+        "w-avg": {"min": 1, "max": 10, "avg": 5.5},
+        "w-max": {"min": 11, "max": 20, "avg": 15.5},
+    }
+    # About 6 points: same buckets
+    response = client.get("/stations/holfuy-1/historic/", params={**params, "points": 6})
+    assert response.json() == aggregates
+
+
+def test_bucket_errors(client, measures):
+    for params in [
+        {"bucket": 600, "points": 6},
+        {"bucket": 0},
+        {"points": 0},
+        {"duration": 8 * 24 * 3600, "bucket": 60},
+    ]:
+        response = client.get("/stations/holfuy-1/historic/", params=params)
+        assert response.status_code == 400, params
+    assert client.get("/stations/holfuy-2/historic/").status_code == 404
+
+
+def test_multiple_stations(client, measures):
+    params = {"ids": ["holfuy-2", "holfuy-1"], "duration": 600, "keys": ["w-avg"]}
+    response = client.get("/stations/historic/", params=params)
+    assert response.status_code == 200
+    assert list(response.json()) == ["holfuy-1"]
+    assert [measure["w-avg"] for measure in response.json()["holfuy-1"]] == list(range(11))
+    response = client.get("/stations/historic/", params={**params, "bucket": 600})
+    assert response.json() == {
+        "holfuy-1": [
+            {"_id": last_time, "w-avg": {"min": 0, "max": 0, "avg": 0}},
+            {"_id": last_time - 600, "w-avg": {"min": 1, "max": 10, "avg": 5.5}},
+        ]
+    }
+    response = client.get("/stations/historic/", params={"ids": [f"holfuy-{i}" for i in range(101)]})
+    assert response.status_code == 400
+
+
+def test_formats(client, measures):
+    params = {"duration": 3600, "keys": ["_id", "w-avg", "w-max"], "bucket": 600, "format": "columnar"}
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    columns = response.json()
+    assert list(columns) == ["_id", "w-avg.min", "w-avg.max", "w-avg.avg", "w-max.min", "w-max.max", "w-max.avg"]
+    assert columns["w-avg.avg"][:2] == [0, 5.5]
+
+    params = {"duration": 120, "keys": ["_id", "w-avg", "pres"], "format": "msgpack"}
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    assert response.headers["content-type"] == "application/vnd.msgpack"
+    assert msgpack.unpackb(response.content) == {
+        "_id": [last_time, last_time - 60, last_time - 120],
+        "w-avg": [0, 1, 2],
+        "pres": [{"qfe": 1000, "qnh": 1013}, {"qfe": 1001, "qnh": 1013}, {"qfe": 1002, "qnh": 1013}],
+    }
+
+
+def test_since(client, measures):
+    response = client.get("/stations/holfuy-1/historic/", params={"since": last_time - 600, "keys": ["w-avg"]})
+    assert [measure["w-avg"] for measure in response.json()] == list(range(10))
+    params = {"since": last_time - 600, "until": last_time - 300, "keys": ["w-avg"]}
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    assert [measure["w-avg"] for measure in response.json()] == list(range(6, 10))
+    # Out of the duration
+    response = client.get("/stations/holfuy-1/historic/", params={"since": last_time - 7200})
+    assert response.status_code == 400
+    response = client.get("/stations/holfuy-1/historic/", params={"since": last_time - 7200, "duration": 7200})
+    assert len(response.json()) == 120
+
+
+def test_paging(client, measures):
+    params = {"duration": 3600, "keys": ["_id", "w-avg"], "limit": 25}
+    pages = []
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    pages.append(response.json())
+    while "x-next-until" in response.headers:
+        until = int(response.headers["x-next-until"])
+        assert until == pages[-1][-1]["_id"]
+        response = client.get("/stations/holfuy-1/historic/", params={**params, "until": until})
+        pages.append(response.json())
+    # The duration is counted from {until}: all the measures are walked
+    assert [len(page) for page in pages] == [25, 25, 25, 25, 20]
+    assert [measure["w-avg"] for page in pages for measure in page] == list(range(120))
+
+    response = client.get("/stations/holfuy-1/historic/", params={**params, "limit": 0})
+    assert response.status_code == 400
+
+
+def test_ndjson(client, measures):
+    params = {"duration": 7200, "keys": ["_id", "w-avg"], "format": "ndjson"}
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.content.splitlines()
+    assert len(lines) == 120
+    assert orjson.loads(lines[1]) == {"_id": last_time - 60, "w-avg": 1}
+
+
+@pytest.fixture
+def rollups(insert, measures):
+    # Hourly rollups of 1 to 4 measures, the pressure only in the even hours
+    insert(
+        "holfuy-1.hourly",
+        [
+            {
+                "_id": last_time - k * 3600,
+                "w-avg": {"min": k, "max": k + 10, "avg": k + 5},
+                **({"pres": {"qfe": 1000 + k}} if k % 2 == 0 else {}),
+                "count": k + 1,
+            }
+            for k in range(4)
+        ],
+    )
+
+
+def test_rollup_pipeline():
+    pipeline = rollup_pipeline({"_id": {"$gte": last_time}}, 3600, "holfuy-1.hourly")
+    assert pipeline[1]["$group"]["count"] == {"$sum": 1}
+    assert pipeline[2]["$project"]["count"] == 1
+    assert pipeline[-1] == {
+        "$merge": {"into": "holfuy-1.hourly", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}
+    }
+
+
+def test_rollup_aggregate_pipeline(mongodb, rollups):
+    pipeline = rollup_aggregate_pipeline({}, 7200, [MeasureKey.id, MeasureKey.w_avg, MeasureKey.pres])
+    aggregates = asyncio.run(mongodb["holfuy-1.hourly"].aggregate(pipeline).to_list(None))
+    # Averages weighted by the number of measures
+    assert aggregates == [
+        {
+            "_id": last_time - 3600,
+            "w-avg": {"min": 0, "max": 11, "avg": pytest.approx((5 * 1 + 6 * 2) / 3)},
+            "pres": {"qfe": 1000, "qnh": None, "qff": None},
+        },
+        {
+            "_id": last_time - 3 * 3600,
+            "w-avg": {"min": 2, "max": 13, "avg": pytest.approx((7 * 3 + 8 * 4) / 7)},
+            "pres": {"qfe": 1002, "qnh": None, "qff": None},
+        },
+    ]
+
+
+def test_rollups(client, rollups):
+    params = {"duration": 8 * 24 * 3600, "keys": ["_id", "w-avg"]}
+    response = client.get("/stations/holfuy-1/historic/", params=params)
+    assert response.status_code == 200
+    assert [aggregate["w-avg"]["avg"] for aggregate in response.json()] == [5, 6, 7, 8]
+    response = client.get("/stations/holfuy-1/historic/", params={**params, "bucket": 7200})
+    assert [aggregate["_id"] for aggregate in response.json()] == [last_time - 3600, last_time - 3 * 3600]
+    response = client.get("/stations/holfuy-1/historic/", params={**params, "bucket": 7200, "limit": 1})
+    assert len(response.json()) == 1
+    # mongomock computes $mod as a float
+    assert float(response.headers["x-next-until"]) == last_time - 3600
+
+
+def test_rollups_missing(client, measures):
+    response = client.get("/stations/holfuy-1/historic/", params={"duration": 8 * 24 * 3600})
+    assert response.status_code == 404
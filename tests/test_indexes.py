@@ -0,0 +1,27 @@
+import asyncio
+
+import pymongo
+
+from winds_mobi_api.indexes import check_indexes, get_missing_indexes, matches
+
+
+def test_matches():
+    assert matches([("last._id", 1)], [("last._id", -1)])
+    assert not matches([("last._id", 1)], [("short", 1)])
+    assert not matches([("loc", "2dsphere")], [("loc", 1)])
+    assert not matches([("a", 1), ("b", 1)], [("a", 1), ("b", -1)])
+
+
+def test_missing_indexes(mongodb):
+    async def run():
+        await mongodb.stations.create_index([("last._id", pymongo.ASCENDING)])
+        await mongodb.stations.create_index([("status", pymongo.DESCENDING)])
+        missing = await get_missing_indexes(mongodb)
+        assert ("stations", [("last._id", pymongo.DESCENDING)]) not in missing
+        assert ("stations", [("status", pymongo.ASCENDING)]) not in missing
+        assert ("stations", [("short", pymongo.ASCENDING)]) in missing
+
+        assert await check_indexes(mongodb, create=True) == []
+        assert await get_missing_indexes(mongodb) == []
+
+    asyncio.run(run())
@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+
+from winds_mobi_api.live import Subscriber, live_updates
+from winds_mobi_api.settings import settings
+from winds_mobi_api.snapshot import stations_snapshot
+
+now = int(time.time())
+
+
+def station(id, provider="holfuy", last_time=now, lon=6.5, lat=46.5, status="green"):
+    return {
+        "_id": id,
+        "pv-code": provider,
+        "short": id,
+        "status": status,
+        "loc": {"type": "Point", "coordinates": [lon, lat]},
+        "last": {"_id": last_time, "w-avg": 10},
+    }
+
+
+class Stream:
+    """
+    Runs a streamed request through the ASGI app until the client disconnects.
+    """
+
+    def __init__(self, app, path, query_string):
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query_string,
+            "headers": [(b"host", b"testserver"), (b"accept-encoding", b"gzip, br")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        self.app = app
+        self.requested = False
+        self.disconnected = asyncio.Event()
+        self.messages = []
+        self.received = asyncio.Event()
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.messages.append(message)
+        self.received.set()
+
+    async def next_message(self):
+        while not self.messages:
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), 1)
+        return self.messages.pop(0)
+
+    def __enter__(self):
+        self.task = asyncio.create_task(self.app(self.scope, self.receive, self.send))
+        return self
+
+    def __exit__(self, *args):
+        self.disconnected.set()
+
+
+@pytest.fixture
+def app(client):
+    stations_snapshot.loaded.set()
+    stations_snapshot.listeners.append(live_updates.publish)
+    return client.app
+
+
+def test_subscriber():
+    subscriber = Subscriber(provider="holfuy", box=((6, 46), (7, 47)))
+    assert subscriber.matches(station("holfuy-1"))
+    assert not subscriber.matches(station("holfuy-1", status="hidden"))
+    assert not subscriber.matches(station("windline-1", provider="windline"))
+    assert not subscriber.matches(station("holfuy-1", lon=8))
+
+    async def run():
+        subscriber.notify(station("holfuy-1", last_time=now))
+        subscriber.notify(station("holfuy-1", last_time=now + 60))
+        # Only the latest update
+        assert [update["last"]["_id"] for update in await subscriber.get_updates(1)] == [now + 60]
+        assert await subscriber.get_updates(0.01) == []
+
+    asyncio.run(run())
+
+
+def test_stream(app, monkeypatch):
+    monkeypatch.setattr(settings, "live_keepalive_interval", 0.2)
+
+    async def run():
+        with Stream(app, "/stations/live/", b"ids=holfuy-1&ids=holfuy-2&keys=short") as stream:
+            start = await stream.next_message()
+            # Sent before the first event and not compressed
+            assert start["type"] == "http.response.start"
+            headers = dict(start["headers"])
+            assert headers[b"content-type"].startswith(b"text/event-stream")
+            assert b"content-encoding" not in headers
+            assert len(live_updates) == 1
+
+            stations_snapshot.put(station("holfuy-1"))
+            stations_snapshot.put(station("holfuy-3"))
+            message = await stream.next_message()
+            assert message["body"] == (
+                b'event: station\ndata: {"_id":"holfuy-1","short":"holfuy-1","last":{"_id":%d}}\n\n' % now
+            )
+            # Same measure: not sent
+            stations_snapshot.put(station("holfuy-1"))
+            message = await stream.next_message()
+            assert message["body"] == b": keepalive\n\n"
+        await asyncio.wait_for(stream.task, 1)
+        assert len(live_updates) == 0
+
+    asyncio.run(run())
+
+
+def test_stream_errors(client):
+    assert client.get("/stations/live/", params={"ids": ["holfuy-1"]}).status_code == 503
+    stations_snapshot.loaded.set()
+    assert client.get("/stations/live/").status_code == 400
+    params = {"within-pt1-lat": 95, "within-pt1-lon": 7, "within-pt2-lat": 46, "within-pt2-lon": 6}
+    assert client.get("/stations/live/", params=params).status_code == 400
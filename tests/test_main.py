@@ -0,0 +1,42 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from winds_mobi_api import database
+from winds_mobi_api.settings import settings
+from winds_mobi_api.snapshot import stations_snapshot
+
+
+def test_lifespan(mongodb, insert, monkeypatch):
+    from winds_mobi_api.main import app
+
+    insert("stations", [{"_id": "holfuy-1", "short": "Suchet", "last": {"_id": 1_700_000_000}}])
+    monkeypatch.setattr(database, "motor_database", mongodb)
+    for name, value in {
+        "mongodb_check_indexes": False,
+        "slow_query_threshold_ms": 0,
+        "stations_snapshot": True,
+        "stations_snapshot_load_timeout": 0.1,
+        "stations_index": False,
+        "search_index": False,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    cancelled = []
+
+    async def run(*args):
+        # Never loaded
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(stations_snapshot, "run", run)
+
+    with TestClient(app) as client:
+        # Served from mongodb
+        response = client.get("/stations/holfuy-1/", params={"keys": ["short"]})
+        assert response.json()["short"] == "Suchet"
+        assert cancelled == []
+    # The cancelled tasks are awaited on shutdown
+    assert cancelled == [True]
@@ -0,0 +1,91 @@
+import asyncio
+import math
+import time
+
+import numpy as np
+import pytest
+
+from winds_mobi_api.markers import cluster_markers, grid_cells
+from winds_mobi_api.stations_index import stations_index
+
+
+def test_grid_cells():
+    # 4 cells along a tile: 16 x 16 cells at zoom 2
+    assert grid_cells([-180, 179.9, 6], [85, -85, 46], 2).tolist() == [0, 255, 5 * 16 + 8]
+    # Latitudes are clipped like web mercator tiles
+    assert grid_cells([0], [90], 0).tolist() == grid_cells([0], [85], 0).tolist()
+
+
+def test_cluster_markers():
+    lon = [6.0, 7.0, 6.5, -70.0, -70.5]
+    lat = [46.0, 46.5, 46.3, -30.0, -30.5]
+    w_avg = [10.0, math.nan, 30.0, math.nan, math.nan]
+    w_max = [20.0, 50.0, 40.0, math.nan, 15.0]
+    clusters = cluster_markers(lon, lat, w_avg, w_max, 2)
+
+    # Ordered by grid cell: north first
+    assert clusters["count"].tolist() == [3, 2]
+    np.testing.assert_allclose(clusters["lon"], [6.5, -70.25])
+    np.testing.assert_allclose(clusters["lat"], [46.266667, -30.25], rtol=1e-6)
+    np.testing.assert_equal(clusters["w-avg"], [30.0, math.nan])
+    np.testing.assert_equal(clusters["w-max"], [50.0, 15.0])
+    # Strongest wind average, the first location without any wind average
+    assert clusters["representative"].tolist() == [2, 3]
+
+
+def test_cluster_markers_zoom():
+    lon = [6.0, 7.0]
+    lat = [46.0, 46.0]
+    assert cluster_markers(lon, lat, [1, 2], [1, 2], 2)["count"].tolist() == [2]
+    assert cluster_markers(lon, lat, [1, 2], [1, 2], 10)["count"].tolist() == [1, 1]
+
+
+@pytest.mark.parametrize("index", [True, False])
+def test_clusters_view(client, mongodb, insert, index):
+    now = int(time.time())
+
+    def station(id, lon, lat, w_avg, w_max, status="green"):
+        return {
+            "_id": id,
+            "short": id,
+            "status": status,
+            "loc": {"type": "Point", "coordinates": [lon, lat]},
+            "clusters": [1],
+            "last": {"_id": now, "w-avg": w_avg, "w-max": w_max},
+        }
+
+    insert(
+        "stations",
+        [
+            station("a", 6.0, 46.0, 10, 20),
+            station("b", 6.1, 46.1, 30, 35),
+            station("c", 7.0, 47.0, None, 50),
+            station("d", 6.2, 46.2, 80, 90, status="hidden"),
+            station("e", 9.0, 46.0, 5, 10),
+        ],
+    )
+    insert("stations_clusters", [{"_id": "save_clusters", "min": 1, "max": 1}])
+    if index:
+        asyncio.run(stations_index.refresh(mongodb))
+
+    box = {"within-pt1-lat": 47.5, "within-pt1-lon": 7.5, "within-pt2-lat": 45.5, "within-pt2-lon": 5.5}
+    response = client.get("/stations/clusters/", params={**box, "zoom": 2, "keys": ["short"]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "loc": {"type": "Point", "coordinates": [pytest.approx(19.1 / 3), pytest.approx(139.1 / 3)]},
+            "count": 3,
+            "w-avg": 30,
+            "w-max": 50,
+            "station": {"_id": "b", "short": "b", "last": {"_id": now}},
+        }
+    ]
+    response = client.get("/stations/clusters/", params={**box, "zoom": 8})
+    clusters = sorted(response.json(), key=lambda cluster: cluster["station"]["_id"])
+    assert [(cluster["station"]["_id"], cluster["count"]) for cluster in clusters] == [("a", 1), ("b", 1), ("c", 1)]
+    assert clusters[2]["w-avg"] is None
+
+    response = client.get("/stations/clusters/", params={**box, "zoom": 21})
+    assert response.status_code == 400
+    response = client.get("/stations/clusters/", params={**box, "within-pt1-lat": 91, "zoom": 8})
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+from winds_mobi_api.models import Status
+from winds_mobi_api.mongo_utils import compile_query, match, project
+
+station = {
+    "_id": "holfuy-1636",
+    "short": "Le Suchet",
+    "pv-code": "holfuy",
+    "status": "green",
+    "peak": True,
+    "duplicates": {"is_highest_rating": True},
+    "loc": {"type": "Point", "coordinates": [6.47, 46.77]},
+    "last": {"_id": 1700000000, "w-avg": 12.5, "w-max": 20.1},
+}
+
+
+def test_match_query_stations():
+    # The query shapes built by `query_stations`
+    assert match(station, {"status": {"$ne": "hidden"}, "last._id": {"$gt": 1690000000}})
+    assert not match(station, {"status": {"$ne": "hidden"}, "last._id": {"$gt": 1710000000}})
+    assert match(station, {"pv-code": "holfuy", "peak": {"$eq": True}})
+    assert not match(station, {"pv-code": "windline"})
+    assert match(station, {"status": {"$eq": Status.green}})
+    assert match(station, {"last._id": {"$gte": 1700000000}})
+    assert match(station, {"duplicates.is_highest_rating": {"$ne": False}})
+    assert match(station, {"_id": {"$in": ["holfuy-1636", "holfuy-1637"]}})
+    assert not match(station, {"_id": {"$in": ["holfuy-1637"]}})
+
+
+def test_match_missing_values():
+    assert match({"_id": "station"}, {"duplicates.is_highest_rating": {"$ne": False}})
+    assert not match({"_id": "station"}, {"last._id": {"$gt": 0}})
+    assert not match({"_id": "station", "last": None}, {"last._id": {"$lte": 0}})
+
+
+def test_project():
+    assert project(station, {"short": 1, "last._id": 1, "last.w-avg": 1}) == {
+        "_id": "holfuy-1636",
+        "short": "Le Suchet",
+        "last": {"_id": 1700000000, "w-avg": 12.5},
+    }
+    assert project(station, {"_id": 1}) == {"_id": "holfuy-1636"}
+    # Missing paths are not returned, like mongodb
+    assert project(station, {"alt": 1, "last.w-dir": 1, "pres.qfe": 1}) == {"_id": "holfuy-1636", "last": {}}
+    assert project({"_id": "station", "last": None}, {"last._id": 1}) == {"_id": "station"}
+
+
+def test_compile_query():
+    query = {"_id": {"$in": ["holfuy-1636", "holfuy-1637"]}, "status": {"$ne": "hidden"}}
+    compiled = compile_query(query)
+    assert compiled["_id"]["$in"] == frozenset(["holfuy-1636", "holfuy-1637"])
+    assert compiled["status"] == {"$ne": "hidden"}
+    assert query["_id"]["$in"] == ["holfuy-1636", "holfuy-1637"]
+    assert match(station, compiled)
+    # Unhashable values are kept as is
+    assert compile_query({"loc.coordinates": {"$in": [[6.47, 46.77]]}}) == {"loc.coordinates": {"$in": [[6.47, 46.77]]}}
@@ -0,0 +1,66 @@
+from winds_mobi_api import rate_limit
+from winds_mobi_api.rate_limit import RateLimiter, client_digest, get_cost
+
+
+def test_acquire(monkeypatch, clock, caplog):
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    limiter = RateLimiter(rate=2, burst=10, max_clients=10)
+    assert limiter.acquire("client", 6) == 0
+    assert limiter.acquire("client", 4) == 0
+    # Seconds to wait for the missing tokens
+    assert limiter.acquire("client", 3) == 1.5
+    assert limiter.buckets["client"].limited == 1
+    # Logged once to identify the client of the digest
+    assert limiter.acquire("client", 3) == 1.5
+    assert caplog.text.count(f"Rate limiting client {client_digest('client')}") == 1
+    clock.now += 1.5
+    assert limiter.acquire("client", 3) == 0
+    assert limiter.buckets["client"].cost == 13
+    # Refilled up to the burst
+    clock.now += 60
+    assert limiter.acquire("client", 10) == 0
+    # Costs above the burst are capped
+    clock.now += 60
+    assert limiter.acquire("client", 100) == 0
+
+
+def test_acquire_eviction(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    limiter = RateLimiter(rate=1, burst=10, max_clients=2)
+    limiter.acquire("a", 10)
+    limiter.acquire("b", 10)
+    limiter.acquire("a", 1)
+    # The least recently seen client is forgotten
+    limiter.acquire("c", 1)
+    assert list(limiter.buckets) == ["a", "c"]
+    assert limiter.acquire("a", 1) > 0
+    assert limiter.acquire("b", 10) == 0
+
+
+def test_get_cost():
+    assert get_cost({"query_string": b"limit=10"}, "/stations/") == 2
+    assert get_cost({"query_string": b"within-pt1-lat=46.5&within-pt1-lon=6.5"}, "/stations/") == rate_limit.box_cost
+    assert get_cost({"query_string": b""}, "/stations/{station_id}/") == 1
+    assert get_cost({"query_string": b""}, "/metrics") == 0
+
+
+def test_client_digest():
+    client = ("192.0.2.1", "winds.mobi/1.0", "https://winds.mobi/")
+    digest = client_digest(client)
+    assert digest == client_digest(client)
+    assert len(digest) == 12
+    assert digest != client_digest(("192.0.2.2", "winds.mobi/1.0", "https://winds.mobi/"))
+
+
+def test_collect(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    limiter = RateLimiter(rate=1, burst=10, max_clients=10)
+    for index, client in enumerate([("192.0.2.1", "", ""), ("192.0.2.2", "", ""), ("192.0.2.3", "", "")]):
+        limiter.acquire(client, index + 1)
+    cost, limited = limiter.collect(limit=2)
+    # Only the heaviest clients, identified by their digest
+    assert [(sample.labels, sample.value) for sample in cost.samples] == [
+        ({"client": client_digest(("192.0.2.3", "", ""))}, 3),
+        ({"client": client_digest(("192.0.2.2", "", ""))}, 2),
+    ]
+    assert [sample.value for sample in limited.samples] == [0, 0]
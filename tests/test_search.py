@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from winds_mobi_api.search import SearchIndex, search_index
+from winds_mobi_api.snapshot import stations_snapshot
+
+
+def load_index():
+    index = SearchIndex()
+    index.load(
+        [
+            {"_id": "a", "name": "Mont-Soleil", "short": "Mont-Soleil"},
+            {"_id": "b", "name": "Col du Mollendruz", "short": "Mollendruz"},
+            {"_id": "c", "name": "Le Suchet", "short": "Suchet"},
+            {"_id": "d", "name": "Dôle Mont", "short": "Dôle"},
+            {"_id": "e", "name": "Piémont", "short": None},
+            {"_id": "f", "name": None, "short": "Chasseral"},
+        ]
+    )
+    return index
+
+
+def test_search_substring():
+    index = load_index()
+    # Contained in the name or the short name, without accent and case insensitive
+    assert index.search(["suchet"]) == ["c"]
+    assert index.search(["DOLE"]) == ["d"]
+    assert index.search(["chass"]) == ["f"]
+    assert index.search(["lendr"]) == ["b"]
+    assert index.search(["nothing"]) == []
+
+
+def test_search_ranking():
+    index = load_index()
+    # Words at the beginning of a word first, then by short name
+    assert index.search(["mont"]) == ["d", "a", "e"]
+    # More matching words first
+    assert index.search(["mont", "soleil"]) == ["a", "d", "e"]
+    assert index.search(["col", "mollendruz", "suchet"]) == ["b", "c"]
+
+
+def test_search_short_words():
+    index = load_index()
+    # Shorter than a trigram: all the stations are candidates
+    assert index.search(["du"]) == ["b"]
+    assert index.search(["le"]) == ["c", "d", "b", "a"]
+
+
+@pytest.mark.parametrize("source", ["snapshot", "mongodb", "regex"])
+def test_search_view(client, mongodb, insert, source):
+    now = int(time.time())
+    insert(
+        "stations",
+        [
+            {"_id": "a", "name": "Mont-Soleil", "short": "Mont-Soleil", "status": "green", "last": {"_id": now}},
+            {"_id": "b", "name": "Dôle Mont", "short": "Dôle", "status": "green", "last": {"_id": now}},
+            {"_id": "c", "name": "Piémont", "short": "Piémont", "status": "hidden", "last": {"_id": now}},
+            {"_id": "d", "name": "Mont Racine", "short": "Racine", "status": "green", "last": {"_id": now - 1000}},
+        ],
+    )
+    if source == "snapshot":
+        asyncio.run(stations_snapshot.load(mongodb))
+    if source != "regex":
+        asyncio.run(search_index.refresh(mongodb))
+
+    response = client.get("/stations/", params={"search": "mont", "keys": ["short"]})
+    assert response.status_code == 200
+    # Hidden stations are excluded, same rank: ordered by short name
+    assert [station["_id"] for station in response.json()] == ["b", "a", "d"]
+    if source != "regex":
+        response = client.get("/stations/", params={"search": "mont", "limit": 2, "last-measure": 600})
+        assert [station["_id"] for station in response.json()] == ["b", "a"]
+        response = client.get("/stations/", params={"search": "mont soleil"})
+        assert [station["_id"] for station in response.json()] == ["a", "b", "d"]
+        response = client.get("/stations/", params={"search": "mont", "ids": ["d", "c", "a"]})
+        assert [station["_id"] for station in response.json()] == ["d", "a"]
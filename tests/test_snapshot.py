@@ -0,0 +1,156 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pymongo
+import pytest
+
+from winds_mobi_api.snapshot import CHANGE_STREAM_NOT_SUPPORTED, StationsSnapshot, stations_snapshot
+
+now = int(time.time())
+
+
+def station(id, provider="holfuy", short=None, status="green", last_time=now):
+    return {"_id": id, "pv-code": provider, "short": short, "status": status, "last": {"_id": last_time}}
+
+
+class ChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.changes:
+            raise StopAsyncIteration
+        return self.changes.pop(0)
+
+
+class WatchedCollection:
+    """
+    mongomock doesn't implement the change streams.
+    """
+
+    def __init__(self, collection, changes=None, error=None):
+        self.collection = collection
+        self.changes = changes or []
+        self.error = error
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+    def watch(self, **kwargs):
+        assert kwargs == {"full_document": "updateLookup"}
+        if self.error:
+            raise self.error
+        return ChangeStream(self.changes)
+
+
+@pytest.fixture
+def stations(insert):
+    insert(
+        "stations",
+        [
+            station("holfuy-1", short="Suchet"),
+            station("holfuy-2", short="Chasseral", status="hidden"),
+            station("windline-1", provider="windline", short="Dôle"),
+            station("windline-2", provider="windline", last_time=now - 3600),
+        ],
+    )
+
+
+def test_load_find(mongodb, stations):
+    snapshot = StationsSnapshot()
+    assert not snapshot.ready
+    asyncio.run(snapshot.load(mongodb))
+    assert snapshot.ready
+
+    assert snapshot.get("holfuy-1", {"short": 1}) == {"_id": "holfuy-1", "short": "Suchet"}
+    assert snapshot.get("holfuy-3", {"short": 1}) is None
+    query = {"status": {"$ne": "hidden"}, "last._id": {"$gt": now - 60}}
+    # Same order as mongodb: missing values first
+    assert snapshot.find(query, {"short": 1}, sort="short") == [
+        {"_id": "windline-1", "short": "Dôle"},
+        {"_id": "holfuy-1", "short": "Suchet"},
+    ]
+    assert snapshot.find({**query, "pv-code": "windline"}, {}) == [{"_id": "windline-1"}]
+    # The order of the ids is kept
+    assert snapshot.find({"_id": {"$in": ["windline-2", "holfuy-3", "holfuy-1", "windline-2"]}}, {}) == [
+        {"_id": "windline-2"},
+        {"_id": "holfuy-1"},
+    ]
+    assert snapshot.find({}, {}, limit=2) == [{"_id": "holfuy-1"}, {"_id": "holfuy-2"}]
+
+
+def test_apply():
+    snapshot = StationsSnapshot()
+    updates = []
+    snapshot.listeners.append(lambda station: updates.append(station["_id"]))
+
+    snapshot.apply({"operationType": "insert", "fullDocument": station("holfuy-1")})
+    # Only the new measures are notified
+    snapshot.apply({"operationType": "update", "fullDocument": {**station("holfuy-1"), "short": "Suchet"}})
+    snapshot.apply({"operationType": "replace", "fullDocument": station("holfuy-1", "windline", last_time=now + 60)})
+    assert snapshot.stations["holfuy-1"]["pv-code"] == "windline"
+    assert snapshot.providers == {"holfuy": {}, "windline": {"holfuy-1": snapshot.stations["holfuy-1"]}}
+    assert updates == ["holfuy-1", "holfuy-1"]
+
+    # Deleted before the update lookup
+    snapshot.apply({"operationType": "update", "fullDocument": None, "documentKey": {"_id": "holfuy-1"}})
+    assert snapshot.stations == {}
+    snapshot.apply({"operationType": "insert", "fullDocument": station("holfuy-2")})
+    snapshot.apply({"operationType": "delete", "documentKey": {"_id": "holfuy-2"}})
+    snapshot.apply({"operationType": "delete", "documentKey": {"_id": "holfuy-3"}})
+    snapshot.apply({"operationType": "invalidate"})
+    assert snapshot.stations == {}
+    assert snapshot.providers == {"holfuy": {}, "windline": {}}
+
+
+def test_watch(mongodb, stations):
+    snapshot = StationsSnapshot()
+    changes = [
+        {"operationType": "update", "fullDocument": {**station("holfuy-1"), "short": "Le Suchet"}},
+        {"operationType": "delete", "documentKey": {"_id": "windline-2"}},
+    ]
+    asyncio.run(snapshot.watch(SimpleNamespace(stations=WatchedCollection(mongodb.stations, changes))))
+    assert snapshot.ready
+    assert snapshot.stations["holfuy-1"]["short"] == "Le Suchet"
+    assert sorted(snapshot.stations) == ["holfuy-1", "holfuy-2", "windline-1"]
+
+
+def test_run_without_change_stream(mongodb, stations):
+    snapshot = StationsSnapshot()
+    error = pymongo.errors.OperationFailure("not a replica set", code=CHANGE_STREAM_NOT_SUPPORTED)
+    database = SimpleNamespace(stations=WatchedCollection(mongodb.stations, error=error))
+
+    async def run():
+        task = asyncio.create_task(snapshot.run(database, change_stream=True, poll_interval=60))
+        # Polls the collection instead
+        await asyncio.wait_for(snapshot.loaded.wait(), 1)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(snapshot.stations) == 4
+
+
+def test_views(client, mongodb, stations):
+    asyncio.run(stations_snapshot.load(mongodb))
+    # Served from the snapshot
+    asyncio.run(mongodb.stations.delete_many({}))
+
+    response = client.get("/stations/holfuy-1/", params={"keys": ["short"]})
+    assert response.status_code == 200
+    assert response.json() == {"_id": "holfuy-1", "short": "Suchet", "last": {"_id": now}}
+    assert client.get("/stations/holfuy-3/").status_code == 404
+
+    response = client.get("/stations/", params={"ids": ["windline-1", "holfuy-2", "holfuy-1"], "keys": ["short"]})
+    assert [station["_id"] for station in response.json()] == ["windline-1", "holfuy-1"]
+    response = client.get("/stations/", params={"provider": "holfuy"})
+    assert [station["_id"] for station in response.json()] == ["holfuy-1"]
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from winds_mobi_api.snapshot import stations_snapshot
+from winds_mobi_api.stations_index import StationsIndex, stations_index
+
+
+def station(id, lon, lat, clusters, **fields):
+    return {"_id": id, "loc": {"type": "Point", "coordinates": [lon, lat]}, "clusters": clusters, **fields}
+
+
+def load_index():
+    index = StationsIndex()
+    index.load(
+        [
+            station("a", 6.0, 46.0, [10, 60], status="green", last={"_id": 100, "w-avg": 5.0}),
+            station("b", 6.1, 46.0, [20], status="green", last={"_id": 100, "w-avg": 15.0}),
+            station("c", 6.3, 46.0, [30], status="orange", last={"_id": 50}),
+            station("d", 6.6, 46.0, [40], status="hidden", last={"_id": 100, "w-avg": 25.0}),
+            station("e", 7.0, 46.0, [50], status="green", last={"_id": 100, "w-avg": 35.0}),
+            # Stations without location are not indexed
+            {"_id": "f", "clusters": [1]},
+        ],
+        {"min": 10, "max": 50},
+    )
+    return index
+
+
+def test_load():
+    index = load_index()
+    assert index.ready
+    assert index.ids.tolist() == ["a", "b", "c", "d", "e"]
+    assert index.clusters.tolist() == [10, 20, 30, 40, 50]
+
+
+def test_mask():
+    index = load_index()
+    mask = index.mask({"status": {"$ne": "hidden"}, "last._id": {"$gt": 60}})
+    assert index.ids[mask].tolist() == ["a", "b", "e"]
+    mask = index.mask({"last.w-avg": {"$gte": 15}, "_id": {"$in": ["b", "c", "d"]}})
+    assert index.ids[mask].tolist() == ["b", "d"]
+    # Not evaluated in memory
+    assert index.mask({"name": "Le Suchet"}) is None
+    assert index.mask({"status": {"$regex": "green"}}) is None
+
+
+def test_select_cluster():
+    index = load_index()
+    mask = np.ones(len(index.ids), dtype=bool)
+    # All the stations can be returned
+    assert index.select_cluster(mask, 5) is None
+    # Highest value selecting at most 2 stations with `clusters: {$elemMatch: {$lte: value}}`
+    assert index.select_cluster(mask, 2) == 29
+    assert index.select_cluster(mask, 4) == 49
+    assert index.select_cluster(mask, 0) == 10
+    assert index.select_cluster(index.within((6.05, 45.0), (7.5, 47.0)), 2) == 39
+
+
+def test_nearest():
+    index = load_index()
+    mask = np.ones(len(index.ids), dtype=bool)
+    assert index.nearest(6.6, 46.0, mask, 3) == ["d", "c", "e"]
+    assert index.nearest(6.6, 46.0, mask, 10) == ["d", "c", "e", "b", "a"]
+    # About 7.7 km per 0.1° of longitude
+    assert index.nearest(6.0, 46.0, mask, 10, max_distance=10000) == ["a", "b"]
+    mask = index.mask({"status": {"$ne": "hidden"}})
+    assert index.nearest(6.6, 46.0, mask, 2) == ["c", "e"]
+    assert index.nearest(6.6, 46.0, np.zeros(len(index.ids), dtype=bool), 2) == []
+
+
+@pytest.mark.parametrize("index", [True, False])
+def test_box_query(client, mongodb, insert, index):
+    now = int(time.time())
+    insert(
+        "stations",
+        [
+            station("a", 6.0, 46.0, [10, 60], status="green", last={"_id": now}),
+            station("b", 6.1, 46.0, [20], status="green", last={"_id": now}),
+            station("c", 6.3, 46.0, [30], status="orange", last={"_id": now}),
+            station("d", 6.6, 46.0, [5], status="hidden", last={"_id": now}),
+            station("e", 7.0, 46.0, [50], status="green", last={"_id": now}),
+            station("f", 9.0, 46.0, [5], status="green", last={"_id": now}),
+        ],
+    )
+    insert("stations_clusters", [{"_id": "save_clusters", "min": 10, "max": 50}])
+    if index:
+        asyncio.run(stations_index.refresh(mongodb))
+
+    box = {"within-pt1-lat": 47, "within-pt1-lon": 7.5, "within-pt2-lat": 45, "within-pt2-lon": 5.5}
+    response = client.get("/stations/", params={**box, "limit": 2})
+    assert response.status_code == 200
+    assert sorted(station["_id"] for station in response.json()) == ["a", "b"]
+    response = client.get("/stations/", params={**box, "limit": 10})
+    assert sorted(station["_id"] for station in response.json()) == ["a", "b", "c", "e"]
+
+
+@pytest.mark.parametrize("snapshot", [True, False])
+def test_near_query(client, mongodb, insert, snapshot):
+    now = int(time.time())
+    insert(
+        "stations",
+        [
+            station("a", 6.0, 46.0, [10], status="green", last={"_id": now}),
+            station("c", 6.3, 46.0, [30], status="orange", last={"_id": now}),
+            station("d", 6.6, 46.0, [40], status="green", last={"_id": now}),
+            station("e", 7.0, 46.0, [50], status="green", last={"_id": now}),
+        ],
+    )
+    insert("stations_clusters", [{"_id": "save_clusters", "min": 10, "max": 50}])
+    if snapshot:
+        asyncio.run(stations_snapshot.load(mongodb))
+    asyncio.run(stations_index.refresh(mongodb))
+    response = client.get("/stations/", params={"near-lat": 46.0, "near-lon": 6.6, "limit": 2})
+    assert [station["_id"] for station in response.json()] == ["d", "c"]
+
+    # Hidden since the index was refreshed
+    asyncio.run(mongodb.stations.update_one({"_id": "d"}, {"$set": {"status": "hidden"}}))
+    if snapshot:
+        stations_snapshot.put({**stations_snapshot.stations["d"], "status": "hidden"})
+    response = client.get("/stations/", params={"near-lat": 46.0, "near-lon": 6.6, "limit": 2, "keys": ["status"]})
+    assert [station["_id"] for station in response.json()] == ["c"]
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from winds_mobi_api.mongo_utils import tile_bounds
+from winds_mobi_api.settings import settings
+
+now = int(time.time())
+
+
+@pytest.fixture
+def stations(insert):
+    sw, ne = tile_bounds(8, 132, 90)
+    lat = (sw[1] + ne[1]) / 2
+
+    def station(id, lon, clusters, status="green"):
+        return {
+            "_id": id,
+            "short": id,
+            "status": status,
+            "loc": {"type": "Point", "coordinates": [lon, lat]},
+            "clusters": clusters,
+            "last": {"_id": now},
+        }
+
+    insert(
+        "stations",
+        [
+            station("a", sw[0] + 0.1, [10]),
+            station("b", sw[0] + 0.2, [20]),
+            station("c", sw[0] + 0.3, [30]),
+            station("d", sw[0] + 0.4, [1], status="hidden"),
+            station("e", ne[0] + 0.1, [1]),
+        ],
+    )
+    insert("stations_clusters", [{"_id": "save_clusters", "min": 10, "max": 30}])
+
+
+def test_tile(client, mongodb, stations):
+    response = client.get("/stations/tiles/8/132/90/", params={"keys": ["short"]})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == f"public, max-age={settings.tile_cache_ttl}"
+    assert sorted(response.json(), key=lambda station: station["_id"]) == [
+        {"_id": "a", "short": "a", "last": {"_id": now}},
+        {"_id": "b", "short": "b", "last": {"_id": now}},
+        {"_id": "c", "short": "c", "last": {"_id": now}},
+    ]
+
+    # Cached
+    asyncio.run(mongodb.stations.delete_one({"_id": "a"}))
+    response = client.get("/stations/tiles/8/132/90/", params={"keys": ["short"], "format": "columnar"})
+    assert sorted(response.json()["_id"]) == ["a", "b", "c"]
+    assert list(response.json()) == ["_id", "short", "last._id"]
+
+    assert [station["_id"] for station in client.get("/stations/tiles/8/133/90/").json()] == ["e"]
+    assert client.get("/stations/tiles/8/133/91/").json() == []
+
+
+def test_tile_thinned(client, stations, monkeypatch):
+    monkeypatch.setattr(settings, "tile_stations", 2)
+    response = client.get("/stations/tiles/8/132/90/")
+    assert sorted(station["_id"] for station in response.json()) == ["a", "b"]
+
+
+@pytest.mark.parametrize("path", ["/stations/tiles/21/0/0/", "/stations/tiles/8/256/0/", "/stations/tiles/8/0/-1/"])
+def test_tile_out_of_bounds(client, path):
+    assert client.get(path).status_code == 400
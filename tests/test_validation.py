@@ -0,0 +1,48 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from winds_mobi_api import validation
+from winds_mobi_api.validation import ValidationMiddleware, get_type_adapter
+
+
+@pytest.fixture
+def validations(monkeypatch):
+    validations = []
+    monkeypatch.setattr(validation, "validate", lambda *args: validations.append(args))
+    return validations
+
+
+def test_middleware(client, insert, validations):
+    insert("stations", [{"_id": "holfuy-1", "short": "Suchet", "last": {"_id": 1_700_000_000}}])
+    sampled_client = TestClient(ValidationMiddleware(client.app, sample_rate=1))
+    assert sampled_client.get("/stations/holfuy-1/", params={"keys": ["short"]}).status_code == 200
+    assert len(validations) == 1
+    type_adapter, body, path = validations[0]
+    assert path == "/stations/{station_id}/"
+    assert b'"short":"Suchet"' in body
+
+    # Not validated
+    assert sampled_client.get("/stations/", params={"format": "columnar"}).status_code == 200
+    assert sampled_client.get("/stations/holfuy-2/").status_code == 404
+    assert TestClient(ValidationMiddleware(client.app, sample_rate=0)).get("/stations/holfuy-1/").status_code == 200
+    assert len(validations) == 1
+
+
+def test_validate(client, caplog):
+    route = next(route for route in client.app.routes if getattr(route, "path", None) == "/stations/{station_id}/")
+    type_adapter = get_type_adapter(route)
+    assert get_type_adapter(route) is type_adapter
+
+    def count(result):
+        return REGISTRY.get_sample_value("response_validations_total", {"route": "test", "result": result}) or 0
+
+    valid, invalid = count("valid"), count("invalid")
+    validation.validate(type_adapter, b'{"_id": "holfuy-1", "short": "Suchet"}', "test")
+    assert count("valid") == valid + 1
+    with caplog.at_level(logging.WARNING):
+        validation.validate(type_adapter, b'{"_id": "holfuy-1", "alt": "high"}', "test")
+    assert count("invalid") == invalid + 1
+    assert "Response of 'test' doesn't match its schema (1 errors)" in caplog.text
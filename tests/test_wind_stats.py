@@ -0,0 +1,85 @@
+import math
+
+import numpy as np
+
+from winds_mobi_api.wind_stats import circular_mean, wind_stats
+
+
+def test_circular_mean():
+    direction, consistency = circular_mean(np.array([350.0, 10.0]), np.array([1.0, 1.0]))
+    assert round(direction % 360, 6) in (0, 360)
+    assert math.isclose(consistency, math.cos(math.radians(10)))
+    direction, consistency = circular_mean(np.array([0.0, 90.0]), np.array([1.0, 3.0]))
+    assert math.isclose(direction, math.degrees(math.atan2(3, 1)))
+    assert all(np.isnan(circular_mean(np.array([90.0]), np.array([0.0]))))
+
+
+def test_wind_stats():
+    nan = math.nan
+    stats = wind_stats(
+        w_dir=[90, 90, 90, 270, nan],
+        w_avg=[10, 10, 10, 0.5, 20],
+        w_max=[15, 15, 15, 1, nan],
+        sectors=4,
+        q=[50, 90],
+    )
+    assert stats["count"] == 5
+    assert stats["w-dir"] == 90
+    assert stats["w-dir-consistency"] == 1
+    assert stats["w-avg"] == {"p50": 10, "p90": 16}
+    assert stats["w-max"] == {"p50": 15, "p90": 15}
+    # Only measures of at least 5 km/h
+    assert stats["gust-factor"] == 1.5
+    # Measures without direction are not counted
+    assert stats["calm"] == 0.25
+    assert [sector["dir"] for sector in stats["wind-rose"]] == [0, 90, 180, 270]
+    assert [sector["frequency"] for sector in stats["wind-rose"]] == [0, 0.75, 0, 0]
+    assert [sector["w-avg"] for sector in stats["wind-rose"]] == [None, 10, None, None]
+    assert stats["wind-rose"][1]["speeds"] == [0, 0.75, 0, 0, 0, 0]
+
+
+def test_wind_stats_north_sector():
+    stats = wind_stats(w_dir=[350, 10, 44], w_avg=[12, 12, 45], w_max=[20, 20, 60], sectors=8, q=[50])
+    assert stats["wind-rose"][0]["frequency"] == round(2 / 3, 4)
+    assert stats["wind-rose"][1]["frequency"] == round(1 / 3, 4)
+    assert stats["wind-rose"][0]["speeds"] == [0, round(2 / 3, 4), 0, 0, 0, 0]
+    assert stats["wind-rose"][1]["speeds"] == [0, 0, 0, 0, round(1 / 3, 4), 0]
+
+
+def test_wind_stats_empty():
+    stats = wind_stats(w_dir=[], w_avg=[], w_max=[], sectors=4, q=[50])
+    assert stats["count"] == 0
+    assert stats["w-dir"] is None
+    assert stats["w-avg"] == {"p50": None}
+    assert stats["gust-factor"] is None
+    assert stats["calm"] is None
+    assert [sector["frequency"] for sector in stats["wind-rose"]] == [0, 0, 0, 0]
+
+
+def test_stats_view(client, insert):
+    last_time = 1_700_000_000
+    insert("stations", [{"_id": "holfuy-1", "last": {"_id": last_time}}])
+    insert(
+        "holfuy-1",
+        [{"_id": last_time - k * 600, "w-dir": 90, "w-avg": 10 + k, "w-max": 15 + k} for k in range(10)],
+    )
+    response = client.get("/stations/holfuy-1/stats/", params={"duration": 3600, "sectors": 4, "percentiles": [50]})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["since"] == last_time - 3600
+    assert stats["until"] == last_time
+    assert stats["count"] == 7
+    assert stats["w-dir"] == 90
+    assert stats["w-avg"] == {"p50": 13}
+    assert [sector["frequency"] for sector in stats["wind-rose"]] == [0, 1, 0, 0]
+
+    for params in [
+        {"duration": 0},
+        {"duration": 8 * 24 * 3600},
+        {"sectors": 3},
+        {"sectors": 37},
+        {"percentiles": [101]},
+        {"percentiles": list(range(11))},
+    ]:
+        assert client.get("/stations/holfuy-1/stats/", params=params).status_code == 400, params
+    assert client.get("/stations/holfuy-2/stats/").status_code == 404
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import uvicorn
+
+from winds_mobi_api.settings import settings
+
+
+def main():
+    workers = settings.workers or os.cpu_count()
+    if settings.metrics and workers > 1:
+        # The workers share their metrics through files
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="winds_mobi_api_metrics_"))
+    uvicorn.run(
+        "winds_mobi_api.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        log_config=settings.log_config_path,
+        proxy_headers=True,
+        root_path=settings.root_path,
+    )
+
+
+if __name__ == "__main__":
+    main()
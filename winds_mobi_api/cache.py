@@ -0,0 +1,154 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import msgpack
+import orjson
+
+from winds_mobi_api.metrics import cache_requests
+from winds_mobi_api.settings import settings
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    Local to the worker, the least recently used entries are evicted above `max_size` entries. Values are not copied.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self.entries[key] = (value, time.time() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def delete(self, key):
+        self.entries.pop(key, None)
+
+
+class RedisBackend:
+    """
+    Shared by the workers, values are serialized with MessagePack. The size is bounded by the redis `maxmemory` and
+    `maxmemory-policy` configuration. Redis failures are logged and handled like cache misses.
+    """
+
+    def __init__(self, url):
+        # Optional dependency (`redis` extra), only required when `CACHE_URL` is set
+        from redis import asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.errors = redis.RedisError
+
+    async def get(self, key):
+        try:
+            data = await self.redis.get(key)
+        except self.errors as e:
+            log.warning(f"Unable to get cache entry '{key}': {e}")
+            return None
+        if data is not None:
+            return msgpack.unpackb(data)
+
+    async def set(self, key, value, ttl):
+        try:
+            await self.redis.set(key, msgpack.packb(value), px=int(ttl * 1000))
+        except self.errors as e:
+            log.warning(f"Unable to set cache entry '{key}': {e}")
+
+    async def delete(self, key):
+        try:
+            await self.redis.delete(key)
+        except self.errors as e:
+            log.warning(f"Unable to delete cache entry '{key}': {e}")
+
+
+class Cache:
+    """
+    Entries are fresh for `ttl` seconds and then served stale for `stale_ttl` seconds while they are refreshed in
+    the background (stale-while-revalidate). With `refresh_ahead`, fresh entries older than `refresh_ahead * ttl` are
+    also refreshed in the background, so popular entries never expire. Concurrent loads of a key are coalesced.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loads = {}
+
+    async def fetch_and_set(self, key, fetch, ttl, stale_ttl):
+        value = await fetch()
+        await self.backend.set(key, [value, time.time()], ttl + stale_ttl)
+        return value
+
+    def loaded(self, key, task):
+        self.loads.pop(key, None)
+        if not task.cancelled() and task.exception():
+            log.warning(f"Unable to load cache entry '{key}': {task.exception()}")
+
+    def load(self, key, fetch, ttl, stale_ttl):
+        if key not in self.loads:
+            task = asyncio.ensure_future(self.fetch_and_set(key, fetch, ttl, stale_ttl))
+            task.add_done_callback(lambda task: self.loaded(key, task))
+            self.loads[key] = task
+        return self.loads[key]
+
+    async def get(self, key, fetch, ttl, stale_ttl=0, refresh_ahead=None, name="default"):
+        entry = await self.backend.get(key)
+        if entry is None:
+            cache_requests.labels(name, "miss").inc()
+            return await asyncio.shield(self.load(key, fetch, ttl, stale_ttl))
+
+        value, created = entry
+        age = time.time() - created
+        if age >= ttl:
+            cache_requests.labels(name, "stale").inc()
+            self.load(key, fetch, ttl, stale_ttl)
+        else:
+            cache_requests.labels(name, "hit").inc()
+            if refresh_ahead is not None and age >= refresh_ahead * ttl:
+                self.load(key, fetch, ttl, stale_ttl)
+        return value
+
+    async def delete(self, key):
+        await self.backend.delete(key)
+
+
+cache = Cache(RedisBackend(settings.cache_url) if settings.cache_url else MemoryBackend(settings.cache_max_size))
+
+
+def cached(ttl, stale_ttl=0, refresh_ahead=None, ignore=("mongodb",)):
+    """
+    Caches the result of a coroutine function by its arguments, except the `ignore` ones. Results must be
+    serializable with MessagePack to be shared with a redis backend.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        prefix = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            key_arguments = {name: value for name, value in arguments.arguments.items() if name not in ignore}
+            key = f"{prefix}:{orjson.dumps(key_arguments, option=orjson.OPT_SORT_KEYS).decode()}"
+            return await cache.get(key, lambda: func(*args, **kwargs), ttl, stale_ttl, refresh_ahead, func.__name__)
+
+        return wrapper
+
+    return decorator
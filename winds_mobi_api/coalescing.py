@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import re
+import time
+
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from winds_mobi_api.metrics import coalescing_requests
+
+log = logging.getLogger(__name__)
+
+# get_station, find_stations, get_station_historic, get_station_stats and the other buffered stations views
+coalesced_paths = re.compile(r"^/stations/(?:[^/]+/(?:historic/|stats/)?)?$")
+# Streamed responses can't be shared
+streamed_paths = {"/stations/live/"}
+# Request headers that change the response
+vary_headers = [b"accept-language", b"if-none-match", b"if-modified-since"]
+# Multi-valued parameters whose order doesn't change the response
+unordered_params = {"keys", "percentiles"}
+# The order of the ids is the order of the response: only the duplicates are ignored
+ordered_params = {"ids"}
+boolean_params = {"is-peak", "is-highest-duplicates-rating"}
+# Values parsed as booleans by pydantic
+boolean_values = {
+    **{value: "true" for value in ["1", "on", "t", "true", "y", "yes"]},
+    **{value: "false" for value in ["0", "off", "f", "false", "n", "no"]},
+}
+
+
+class ResponseCoalescer:
+    """
+    Single-flight of identical concurrent requests: the first request runs the view, the other ones wait for its
+    response. Responses are then kept for `cache_ttl` seconds.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.cache = {}
+
+    def prune(self, now):
+        # Entries are inserted in expiration order: only the expired ones at the start are visited
+        while self.cache:
+            key, (expires, _) = next(iter(self.cache.items()))
+            if expires > now:
+                break
+            del self.cache[key]
+
+    async def get(self, key, fetch, cache_ttl):
+        now = time.monotonic()
+        self.prune(now)
+        if key in self.cache:
+            coalescing_requests.labels("hit").inc()
+            return self.cache[key][1]
+        if key in self.flights:
+            coalescing_requests.labels("coalesced").inc()
+            return await asyncio.shield(self.flights[key])
+
+        coalescing_requests.labels("miss").inc()
+        future = asyncio.ensure_future(fetch())
+        self.flights[key] = future
+        try:
+            # The other requests still get the response if this one is cancelled
+            response = await asyncio.shield(future)
+        finally:
+            if future.done():
+                self.flights.pop(key, None)
+            else:
+                future.add_done_callback(lambda _: self.flights.pop(key, None))
+        if cache_ttl > 0 and response[0] < 500:
+            self.cache.pop(key, None)
+            self.cache[key] = (time.monotonic() + cache_ttl, response)
+        return response
+
+
+response_coalescer = ResponseCoalescer()
+
+
+def get_path(scope: Scope):
+    return scope["path"].removeprefix(scope.get("root_path", ""))
+
+
+def normalize_values(name, values):
+    if name in unordered_params:
+        return sorted(set(values))
+    if name in ordered_params:
+        return list(dict.fromkeys(values))
+    if name in boolean_params:
+        return [boolean_values.get(value.lower(), value) for value in values]
+    return values
+
+
+def get_key(scope: Scope):
+    """
+    Equivalent requests have the same key: the parameters are sorted by name and their values normalized.
+    """
+    params = {}
+    for name, value in QueryParams(scope["query_string"]).multi_items():
+        params.setdefault(name, []).append(value)
+    query = tuple((name, tuple(normalize_values(name, values))) for name, values in sorted(params.items()))
+    headers = dict(scope["headers"])
+    return (get_path(scope), query, tuple(headers.get(name) for name in vary_headers))
+
+
+class CoalescingMiddleware:
+    def __init__(self, app: ASGIApp, cache_ttl: float):
+        self.app = app
+        self.cache_ttl = cache_ttl
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or get_path(scope) in streamed_paths
+            or not coalesced_paths.match(get_path(scope))
+            or QueryParams(scope["query_string"]).get("format") == "ndjson"
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def fetch():
+            messages = []
+
+            async def capture(message):
+                messages.append(message)
+
+            await self.app(scope, receive, capture)
+            start = next(message for message in messages if message["type"] == "http.response.start")
+            body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+            return start["status"], start.get("headers", []), body
+
+        status, headers, body = await response_coalescer.get(get_key(scope), fetch, self.cache_ttl)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
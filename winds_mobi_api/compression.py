@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import hashlib
+from collections import OrderedDict
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from winds_mobi_api.metrics import compression_requests
+
+try:
+    # Optional dependency (`zstd` extra), zstd is only negotiated when it is installed
+    import zstandard
+except ImportError:
+    zstandard = None
+
+compressors = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+    "br": lambda body: brotli.compress(body, quality=5),
+}
+if zstandard is not None:
+    compressors["zstd"] = zstandard.ZstdCompressor(level=3).compress
+
+# Preferred encodings first when the client accepts several of them with the same quality
+preferences = ["zstd", "br", "gzip"]
+compressible_types = (b"application/json", b"application/x-ndjson", b"application/vnd.msgpack", b"text/")
+# Bodies larger than this are compressed in a thread
+executor_min_size = 256 * 1024
+
+
+def negotiate(accept_encoding: str):
+    """
+    Returns the preferred encoding accepted by the client, or None to send the identity.
+    """
+    qualities = {}
+    for value in accept_encoding.split(","):
+        encoding, _, params = value.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        qualities[encoding.strip().lower()] = quality
+    candidates = [
+        (qualities.get(encoding, qualities.get("*", 0)), -index, encoding)
+        for index, encoding in enumerate(preferences)
+        if encoding in compressors
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+class CompressedBodies:
+    """
+    Compressed bodies by digest of the raw body and encoding, the least recently used ones are evicted above `max_size`
+    bytes. Hot responses are compressed only once per encoding.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        body = self.entries.get(key)
+        if body is not None:
+            self.entries.move_to_end(key)
+        return body
+
+    def set(self, key, body):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """
+    Negotiates the response encoding with `Accept-Encoding` (zstd, br or gzip). Streamed responses are sent as is.
+    """
+
+    def __init__(self, app: ASGIApp, min_size: int, cache_size: int):
+        self.app = app
+        self.min_size = min_size
+        self.bodies = CompressedBodies(cache_size)
+
+    async def compress(self, encoding, body):
+        # Weak ETags don't identify the bytes of the body: a station can change without a new measure
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        compressed = self.bodies.get(key)
+        if compressed is not None:
+            compression_requests.labels(encoding, "hit").inc()
+            return compressed
+        compression_requests.labels(encoding, "miss").inc()
+        if len(body) >= executor_min_size:
+            loop = asyncio.get_running_loop()
+            compressed = await loop.run_in_executor(None, compressors[encoding], body)
+        else:
+            compressed = compressors[encoding](body)
+        self.bodies.set(key, compressed)
+        return compressed
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        streaming = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if "content-length" not in headers or headers.get("content-type", "").startswith("text/event-stream"):
+                    # Streamed response (ndjson, server-sent events): the headers are sent without waiting for the body
+                    streaming = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            # Copied: the coalesced responses share their headers list
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                streaming = True
+                await send(start)
+                await send(message)
+                return
+            if (
+                start["status"] == 200
+                and len(body) >= self.min_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").encode().startswith(compressible_types)
+            ):
+                body = await self.compress(encoding, body)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,39 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+import orjson
+from fastapi import HTTPException
+from starlette.requests import Request
+
+
+def get_etag(request: Request, last_time: int):
+    """
+    Weak ETag of a response that only changes with the last measure time of a station and the request parameters.
+    """
+    key = orjson.dumps([request.url.path, sorted(request.query_params.multi_items()), last_time])
+    return f'W/"{hashlib.blake2b(key, digest_size=12).hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str, last_time: int):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+        return "*" in etags or etag.removeprefix("W/") in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return last_time <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def check_conditional_request(request: Request, last_time: int):
+    """
+    Returns the ETag and Last-Modified headers of the response or raises a 304 if the client already has it.
+    """
+    etag = get_etag(request, last_time)
+    headers = {"ETag": etag, "Last-Modified": formatdate(last_time, usegmt=True)}
+    if is_not_modified(request, etag, last_time):
+        raise HTTPException(status_code=304, headers=headers)
+    return headers
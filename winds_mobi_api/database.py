@@ -1,6 +1,8 @@
 from motor import motor_asyncio
 
+from winds_mobi_api.metrics import CommandListener
 from winds_mobi_api.settings import settings
+from winds_mobi_api.slow_queries import slow_query_listener
 
 motor_database = None
 
@@ -8,5 +10,16 @@ motor_database = None
 def mongodb():
     global motor_database
     if motor_database is None:
-        motor_database = motor_asyncio.AsyncIOMotorClient(settings.mongodb_url).get_database()
+        motor_database = motor_asyncio.AsyncIOMotorClient(
+            settings.mongodb_url,
+            maxPoolSize=settings.mongodb_max_pool_size,
+            minPoolSize=settings.mongodb_min_pool_size,
+            connectTimeoutMS=settings.mongodb_connect_timeout_ms,
+            serverSelectionTimeoutMS=settings.mongodb_server_selection_timeout_ms,
+            waitQueueTimeoutMS=settings.mongodb_wait_queue_timeout_ms,
+            event_listeners=[
+                *([CommandListener()] if settings.metrics else []),
+                *([slow_query_listener] if settings.slow_query_threshold_ms > 0 else []),
+            ],
+        ).get_database()
     return motor_database
@@ -3,33 +3,17 @@
 diacritics = "ŠŒŽšœžŸ¥µÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÐÑÒÓÔÕÖØÙÚÛÜÝßàáâãäåæçèéêëìíîïðñòóôõöøùúûüýÿ"
 asciis = "SOZsozYYuAAAAAAACEEEEIIIIDNOOOOOOUUUUYsaaaaaaaceeeeiiiionoooooouuuuyy"
 
+normalize_table = str.maketrans(diacritics, asciis)
 
-def normalize(str):
-    new_str = ""
-    for char in str:
-        new_char = char
-        for i, diacritic in enumerate(diacritics):
-            if char == diacritic:
-                new_char = asciis[i]
-                break
-        new_str += new_char
-
-    return new_str
+regexp_classes = {}
+for diacritic, ascii in zip(diacritics, asciis):
+    regexp_classes[ascii] = regexp_classes.get(ascii, "") + diacritic
+regexp_table = str.maketrans({ascii: f"[{chars}{ascii}]" for ascii, chars in regexp_classes.items()})
 
 
-def create_regexp(str):
-    reg_exp = ""
-    for char in str:
-        found = False
-        for i, ascii in enumerate(asciis):
-            if char == ascii:
-                if not found:
-                    reg_exp += "["
-                    found = True
-                reg_exp += diacritics[i]
+def normalize(str):
+    return str.translate(normalize_table)
 
-        reg_exp += char
-        if found:
-            reg_exp += "]"
 
-    return reg_exp
+def create_regexp(str):
+    return str.translate(regexp_table)
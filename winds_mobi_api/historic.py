@@ -0,0 +1,159 @@
+from winds_mobi_api.models import MeasureKey, measure_key_defaults
+
+pressure_keys = ["qfe", "qnh", "qff"]
+
+
+def group_stage(bucket, keys):
+    """
+    $group stage aggregating the measures by intervals of `bucket` seconds: min/max/avg of the values, average of the
+    pressures and circular mean of the wind direction.
+    """
+    group = {"_id": {"$subtract": ["$_id", {"$mod": ["$_id", bucket]}]}}
+    for key in keys:
+        if key == MeasureKey.id:
+            continue
+        elif key == MeasureKey.w_dir:
+            radians = {"$degreesToRadians": f"${key.value}"}
+            group["w-dir-sin"] = {"$avg": {"$sin": radians}}
+            group["w-dir-cos"] = {"$avg": {"$cos": radians}}
+        elif key == MeasureKey.pres:
+            for pressure_key in pressure_keys:
+                group[f"pres-{pressure_key}"] = {"$avg": f"$pres.{pressure_key}"}
+        else:
+            group[f"{key.value}-min"] = {"$min": f"${key.value}"}
+            group[f"{key.value}-max"] = {"$max": f"${key.value}"}
+            group[f"{key.value}-avg"] = {"$avg": f"${key.value}"}
+    return {"$group": group}
+
+
+def project_stage(keys):
+    """
+    $project stage returning the grouped values in the `MeasureAggregate` format.
+    """
+    project = {}
+    for key in keys:
+        if key == MeasureKey.id:
+            continue
+        elif key == MeasureKey.w_dir:
+            degrees = {"$round": [{"$radiansToDegrees": {"$atan2": ["$w-dir-sin", "$w-dir-cos"]}}, 0]}
+            project["w-dir"] = {"$mod": [{"$add": [degrees, 360]}, 360]}
+        elif key == MeasureKey.pres:
+            project["pres"] = {pressure_key: f"$pres-{pressure_key}" for pressure_key in pressure_keys}
+        else:
+            project[key.value] = {
+                "min": f"${key.value}-min",
+                "max": f"${key.value}-max",
+                "avg": f"${key.value}-avg",
+            }
+    return {"$project": project or {"_id": 1}}
+
+
+def aggregate_pipeline(query, bucket, keys):
+    return [
+        {"$match": query},
+        group_stage(bucket, keys),
+        project_stage(keys),
+        {"$sort": {"_id": -1}},
+    ]
+
+
+def columns_pipeline(query, keys):
+    """
+    Pipeline returning the values of the measures as one array per key, in chronological order. Missing values are
+    null to keep the arrays aligned.
+    """
+    push = {key.value: {"$push": {"$ifNull": [f"${key.value}", None]}} for key in keys}
+    return [
+        {"$match": query},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": None, **push}},
+    ]
+
+
+def rollup_pipeline(query, resolution, collection):
+    """
+    Pipeline aggregating the measures by intervals of `resolution` seconds into the `collection` rollup: all the keys
+    in the `MeasureAggregate` format and the number of measures. Existing intervals are replaced.
+    """
+    group = group_stage(resolution, measure_key_defaults)
+    group["$group"]["count"] = {"$sum": 1}
+    project = project_stage(measure_key_defaults)
+    project["$project"]["count"] = 1
+    return [
+        {"$match": query},
+        group,
+        project,
+        {"$merge": {"into": collection, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def rollup_group_stage(bucket, keys):
+    """
+    Like `group_stage` but aggregating rollup documents: min of the minimums, max of the maximums and averages weighted
+    by the number of measures of each rollup. The weighted averages are computed by `rollup_average_stage`.
+    """
+    weight = {"$ifNull": ["$count", 1]}
+    group = {"_id": {"$subtract": ["$_id", {"$mod": ["$_id", bucket]}]}}
+
+    def weighted_sum(name, path):
+        # Rollups without the value don't count in the average
+        group[f"{name}-sum"] = {"$sum": {"$multiply": [path, weight]}}
+        group[f"{name}-weight"] = {"$sum": {"$cond": [{"$eq": [{"$ifNull": [path, None]}, None]}, 0, weight]}}
+
+    for key in keys:
+        if key == MeasureKey.id:
+            continue
+        elif key == MeasureKey.w_dir:
+            radians = {"$degreesToRadians": f"${key.value}"}
+            group["w-dir-sin"] = {"$sum": {"$multiply": [{"$sin": radians}, weight]}}
+            group["w-dir-cos"] = {"$sum": {"$multiply": [{"$cos": radians}, weight]}}
+        elif key == MeasureKey.pres:
+            for pressure_key in pressure_keys:
+                weighted_sum(f"pres-{pressure_key}", f"$pres.{pressure_key}")
+        else:
+            group[f"{key.value}-min"] = {"$min": f"${key.value}.min"}
+            group[f"{key.value}-max"] = {"$max": f"${key.value}.max"}
+            weighted_sum(f"{key.value}-avg", f"${key.value}.avg")
+    return {"$group": group}
+
+
+def rollup_average_stage(keys):
+    """
+    $set stage dividing the weighted sums of `rollup_group_stage`, or None without averaged keys.
+    """
+    names = []
+    for key in keys:
+        if key == MeasureKey.pres:
+            names += [f"pres-{pressure_key}" for pressure_key in pressure_keys]
+        elif key not in (MeasureKey.id, MeasureKey.w_dir):
+            names.append(f"{key.value}-avg")
+    if not names:
+        return None
+    averages = {
+        name: {"$cond": [{"$gt": [f"${name}-weight", 0]}, {"$divide": [f"${name}-sum", f"${name}-weight"]}, None]}
+        for name in names
+    }
+    return {"$set": averages}
+
+
+def rollup_aggregate_pipeline(query, bucket, keys):
+    pipeline = [{"$match": query}, rollup_group_stage(bucket, keys)]
+    average_stage = rollup_average_stage(keys)
+    if average_stage:
+        pipeline.append(average_stage)
+    return [*pipeline, project_stage(keys), {"$sort": {"_id": -1}}]
+
+
+def aggregate_paths(keys):
+    """
+    Paths of the aggregated values, used by the columnar formats.
+    """
+    paths = []
+    for key in keys:
+        if key in (MeasureKey.id, MeasureKey.w_dir):
+            paths.append(key.value)
+        elif key == MeasureKey.pres:
+            paths += [f"pres.{pressure_key}" for pressure_key in pressure_keys]
+        else:
+            paths += [f"{key.value}.min", f"{key.value}.max", f"{key.value}.avg"]
+    return paths
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+import pymongo
+
+log = logging.getLogger(__name__)
+
+# Indexes used by the queries of the views. The per-station measure collections are only queried by `_id` which is
+# always indexed.
+required_indexes = {
+    "stations": [
+        [("loc", pymongo.GEOSPHERE)],
+        [("last._id", pymongo.DESCENDING)],
+        [("pv-code", pymongo.ASCENDING)],
+        [("status", pymongo.ASCENDING)],
+        [("short", pymongo.ASCENDING)],
+        [("clusters", pymongo.ASCENDING)],
+    ],
+}
+
+
+def normalize_keys(keys):
+    # index_information() returns the directions as floats with some mongodb versions
+    return [(field, int(direction) if isinstance(direction, float) else direction) for field, direction in keys]
+
+
+def matches(keys, existing_keys):
+    # A single-field index is walked in both directions: only the field of the ascending and descending ones matters
+    directions = {pymongo.ASCENDING, pymongo.DESCENDING}
+    if len(keys) == len(existing_keys) == 1 and keys[0][1] in directions and existing_keys[0][1] in directions:
+        return keys[0][0] == existing_keys[0][0]
+    return keys == existing_keys
+
+
+async def get_missing_indexes(mongodb):
+    missing = []
+    for collection, indexes in required_indexes.items():
+        existing = [normalize_keys(index["key"]) for index in (await mongodb[collection].index_information()).values()]
+        for keys in indexes:
+            if not any(matches(keys, existing_keys) for existing_keys in existing):
+                missing.append((collection, keys))
+    return missing
+
+
+async def check_indexes(mongodb, create=False):
+    """
+    Logs the missing indexes and creates them if `create` is set. Returns the indexes that are still missing.
+    """
+    missing = await get_missing_indexes(mongodb)
+    for collection, keys in missing:
+        if create:
+            log.warning(f"Creating missing index {keys} on '{collection}'")
+            await mongodb[collection].create_index(keys)
+        else:
+            log.warning(f"Missing index {keys} on '{collection}': queries will be slow")
+    return [] if create else missing
+
+
+async def main(create):
+    from winds_mobi_api.database import mongodb
+
+    missing = await check_indexes(mongodb(), create)
+    if missing:
+        sys.exit(1)
+    log.info("All the required indexes exist")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Check the mongodb indexes required by the API")
+    parser.add_argument("--create", action="store_true", help="Create the missing indexes")
+    asyncio.run(main(parser.parse_args().create))
@@ -1,5 +1,5 @@
 from accept_language import parse_accept_language
-from stop_words import LANGUAGE_MAPPING
+from stop_words import LANGUAGE_MAPPING, StopWordError, get_stop_words
 
 supported_languages = list(LANGUAGE_MAPPING.keys())
 
@@ -9,3 +9,11 @@ def negotiate_language(accept_language, default="en"):
         if locale.language in supported_languages:
             return locale.language
     return default
+
+
+def remove_stop_words(words, language):
+    try:
+        stop_words = get_stop_words(language)
+    except StopWordError:
+        stop_words = get_stop_words("en")
+    return [word for word in words if word not in stop_words]
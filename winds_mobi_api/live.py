@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from winds_mobi_api.mongo_utils import LAT, LNG, get_value
+
+log = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    Pending updates of a client. Only the latest update of each station is kept: a slow client skips the intermediate
+    measures instead of buffering them.
+    """
+
+    def __init__(self, ids=None, provider=None, box=None):
+        self.ids = ids
+        self.provider = provider
+        self.box = box
+        self.pending = {}
+        self.updated = asyncio.Event()
+
+    def matches(self, station):
+        if station.get("status") == "hidden":
+            return False
+        if self.provider is not None and station.get("pv-code") != self.provider:
+            return False
+        if self.box is not None:
+            coordinates = get_value(station, "loc.coordinates")
+            if not coordinates:
+                return False
+            sw, ne = self.box
+            if not (sw[LNG] <= coordinates[LNG] <= ne[LNG] and sw[LAT] <= coordinates[LAT] <= ne[LAT]):
+                return False
+        return True
+
+    def notify(self, station):
+        if self.matches(station):
+            self.pending[station["_id"]] = station
+            self.updated.set()
+
+    async def get_updates(self, timeout):
+        """
+        Waits at most `timeout` seconds for updates and returns them.
+        """
+        try:
+            await asyncio.wait_for(self.updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.updated.clear()
+        stations, self.pending = list(self.pending.values()), {}
+        return stations
+
+
+class LiveUpdates:
+    """
+    Fans out the station updates of the snapshot to the subscribers. Subscribers are indexed by station id and by
+    provider to only check the interested ones.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.by_id = {}
+        self.by_provider = {}
+        self.others = set()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, subscriber):
+        self.subscribers.add(subscriber)
+        if subscriber.ids is not None:
+            for station_id in subscriber.ids:
+                self.by_id.setdefault(station_id, set()).add(subscriber)
+        elif subscriber.provider is not None:
+            self.by_provider.setdefault(subscriber.provider, set()).add(subscriber)
+        else:
+            self.others.add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if subscriber.ids is not None:
+            for station_id in subscriber.ids:
+                subscribers = self.by_id.get(station_id, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self.by_id.pop(station_id, None)
+        elif subscriber.provider is not None:
+            subscribers = self.by_provider.get(subscriber.provider, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.by_provider.pop(subscriber.provider, None)
+        else:
+            self.others.discard(subscriber)
+
+    def publish(self, station):
+        for subscriber in self.by_id.get(station["_id"], ()):
+            subscriber.notify(station)
+        for subscriber in self.by_provider.get(station.get("pv-code"), ()):
+            subscriber.notify(station)
+        for subscriber in self.others:
+            subscriber.notify(station)
+
+
+live_updates = LiveUpdates()
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from logging.config import dictConfig
 
 import bson
@@ -13,7 +14,19 @@ from starlette.requests import Request
 from starlette.responses import JSONResponse, RedirectResponse
 
 from winds_mobi_api import views
+from winds_mobi_api.coalescing import CoalescingMiddleware
+from winds_mobi_api.compression import CompressionMiddleware
+from winds_mobi_api.database import mongodb
+from winds_mobi_api.indexes import check_indexes
+from winds_mobi_api.live import live_updates
+from winds_mobi_api.metrics import MetricsMiddleware, local_collectors, metrics
+from winds_mobi_api.rate_limit import RateLimitMiddleware, rate_limiter
+from winds_mobi_api.search import search_index
 from winds_mobi_api.settings import settings
+from winds_mobi_api.slow_queries import slow_query_listener
+from winds_mobi_api.snapshot import stations_snapshot
+from winds_mobi_api.stations_index import stations_index
+from winds_mobi_api.validation import ValidationMiddleware
 
 with open(settings.log_config_path, "r") as file:
     dictConfig(yaml.load(file, Loader=yaml.FullLoader))
@@ -23,11 +36,57 @@ log = logging.getLogger(__name__)
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
+
+async def warmup():
+    """
+    Opens the connections of the pool, loads the cached data and checks the indexes before accepting requests.
+    """
+    try:
+        await asyncio.gather(*[mongodb().command("ping") for _ in range(max(settings.mongodb_min_pool_size, 1))])
+        await asyncio.gather(views.get_collection_names(mongodb()), views.get_save_clusters(mongodb()))
+        if settings.mongodb_check_indexes:
+            await check_indexes(mongodb(), create=settings.mongodb_create_indexes)
+    except pymongo.errors.PyMongoError as e:
+        log.error(f"Unable to warm up the mongodb connections and caches: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warmup()
+    tasks = []
+    if settings.slow_query_threshold_ms > 0:
+        tasks.append(asyncio.create_task(slow_query_listener.run(mongodb().client)))
+    if settings.stations_snapshot:
+        stations_snapshot.listeners.append(live_updates.publish)
+        tasks.append(
+            asyncio.create_task(
+                stations_snapshot.run(
+                    mongodb(), settings.stations_snapshot_change_stream, settings.stations_snapshot_poll_interval
+                )
+            )
+        )
+        # Serve requests once the snapshot is loaded
+        try:
+            await asyncio.wait_for(stations_snapshot.loaded.wait(), settings.stations_snapshot_load_timeout)
+        except asyncio.TimeoutError:
+            log.error("Stations snapshot not loaded on startup, the requests are served from mongodb until it is")
+    if settings.stations_index:
+        tasks.append(asyncio.create_task(stations_index.run(mongodb(), settings.stations_index_refresh_interval)))
+    if settings.search_index:
+        tasks.append(asyncio.create_task(search_index.run(mongodb(), settings.search_index_refresh_interval)))
+    yield
+    for task in tasks:
+        task.cancel()
+    # Let the tasks handle their cancellation before the event loop is closed
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 app = FastAPI(
     title="winds.mobi",
     version="2.3",
     root_path=settings.root_path,
     docs_url=f"/{settings.doc_path}",
+    lifespan=lifespan,
     description="""### Feel free to "fair use" this API
 Winds.mobi is a free, community [open source](https://github.com/winds-mobi) project. The data indexed by winds.mobi 
 are kindly shared by their providers and belong to them.
@@ -52,7 +111,21 @@ Yann
 info@winds.mobi
 """,  # noqa: W291
 )
-app.add_middleware(CORSMiddleware, allow_origins=["*"])
+if not settings.response_schema_validation and settings.response_schema_validation_sample_rate > 0:
+    app.add_middleware(ValidationMiddleware, sample_rate=settings.response_schema_validation_sample_rate)
+if settings.coalescing:
+    app.add_middleware(CoalescingMiddleware, cache_ttl=settings.coalescing_cache_ttl)
+if settings.compression:
+    app.add_middleware(
+        CompressionMiddleware, min_size=settings.compression_min_size, cache_size=settings.compression_cache_size
+    )
+if settings.rate_limit:
+    app.add_middleware(RateLimitMiddleware, rate_limiter=rate_limiter)
+    local_collectors.append(rate_limiter)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], expose_headers=["X-Next-Until"])
+if settings.metrics:
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
 
 
 @app.exception_handler(pymongo.errors.OperationFailure)
@@ -0,0 +1,50 @@
+import math
+
+import numpy as np
+
+# Number of grid cells along a 256px web mercator tile
+cells_per_tile = 4
+
+
+def grid_cells(lon, lat, zoom):
+    """
+    Returns the web mercator grid cell of each location at the given zoom level.
+    """
+    size = cells_per_tile * 2**zoom
+    x = (np.asarray(lon) + 180) / 360
+    y = (1 - np.log(np.tan(np.radians(np.clip(lat, -85, 85)) / 2 + math.pi / 4)) / math.pi) / 2
+    cell_x = np.clip(np.floor(x * size), 0, size - 1).astype(np.int64)
+    cell_y = np.clip(np.floor(y * size), 0, size - 1).astype(np.int64)
+    return cell_y * size + cell_x
+
+
+def cluster_markers(lon, lat, w_avg, w_max, zoom):
+    """
+    Groups the locations by grid cell. Returns the centroid, count and max wind of each cluster and the index of its
+    representative location: the one with the strongest wind average.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    w_avg = np.asarray(w_avg, dtype=float)
+    w_max = np.asarray(w_max, dtype=float)
+
+    _, inverse, counts = np.unique(grid_cells(lon, lat, zoom), return_inverse=True, return_counts=True)
+    centroid_lon = np.bincount(inverse, weights=lon) / counts
+    centroid_lat = np.bincount(inverse, weights=lat) / counts
+    max_w_avg = np.full(len(counts), np.nan)
+    np.fmax.at(max_w_avg, inverse, w_avg)
+    max_w_max = np.full(len(counts), np.nan)
+    np.fmax.at(max_w_max, inverse, w_max)
+
+    # Sort by cluster then by descending wind average (NaN last): the first location of each cluster is the strongest
+    order = np.lexsort((-np.nan_to_num(w_avg, nan=-np.inf), inverse))
+    representatives = order[np.searchsorted(inverse[order], np.arange(len(counts)))]
+
+    return {
+        "lon": centroid_lon,
+        "lat": centroid_lat,
+        "count": counts,
+        "w-avg": max_w_avg,
+        "w-max": max_w_max,
+        "representative": representatives,
+    }
@@ -0,0 +1,143 @@
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests", ["method", "route", "status"]
+)
+response_size = Histogram(
+    "http_response_size_bytes",
+    "Size of the HTTP response bodies",
+    ["route"],
+    buckets=[100, 1000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000],
+)
+mongodb_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "Duration of the mongodb commands", ["command", "status"]
+)
+mongodb_request_commands = Histogram(
+    "mongodb_request_commands",
+    "Number of mongodb round trips per HTTP request",
+    ["route"],
+    buckets=[0, 1, 2, 3, 5, 10, 20, 50, 100],
+)
+mongodb_request_documents = Histogram(
+    "mongodb_request_documents",
+    "Number of documents returned by mongodb per HTTP request",
+    ["route"],
+    buckets=[0, 1, 10, 50, 100, 500, 1000, 5000, 10_000, 50_000],
+)
+cache_requests = Counter("cache_requests_total", "Cache lookups", ["name", "result"])
+response_validations = Counter(
+    "response_validations_total", "Sampled validations of the responses schema", ["route", "result"]
+)
+compression_requests = Counter(
+    "compression_requests_total", "Compressed responses cache lookups", ["encoding", "result"]
+)
+rate_limit_requests = Counter("rate_limit_requests_total", "Rate limited HTTP requests", ["route", "result"])
+coalescing_requests = Counter("coalescing_requests_total", "Coalesced HTTP requests", ["result"])
+cluster_selection_duration = Histogram(
+    "cluster_selection_duration_seconds",
+    "Duration of the selection of the clusters value of a box query",
+    ["method"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1],
+)
+# Collectors of the worker state, not aggregated between the workers
+local_collectors = []
+
+
+class RequestStats:
+    def __init__(self):
+        self.commands = 0
+        self.documents = 0
+
+
+# Motor runs the pymongo calls in threads with a copy of the context: the listener updates the stats of the request
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+class CommandListener(monitoring.CommandListener):
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        mongodb_command_duration.labels(event.command_name, "succeeded").observe(event.duration_micros / 1e6)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            cursor = event.reply.get("cursor")
+            if isinstance(cursor, dict):
+                stats.documents += len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        mongodb_command_duration.labels(event.command_name, "failed").observe(event.duration_micros / 1e6)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+
+
+def get_route(scope: Scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return ""
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = get_route(scope)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_duration.labels(scope["method"], route, status).observe(time.perf_counter() - start)
+            response_size.labels(route).observe(size)
+            mongodb_request_commands.labels(route).observe(stats.commands)
+            mongodb_request_documents.labels(route).observe(stats.documents)
+            request_stats.reset(token)
+
+
+def metrics(request: Request):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregates the metrics of all the workers
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    output = generate_latest(registry) + b"".join(generate_latest(collector) for collector in local_collectors)
+    return Response(output, media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Union
 
 from pydantic import BaseModel, Field
 
@@ -11,6 +11,13 @@ class Status(str, Enum):
     red = "red"
 
 
+class Format(str, Enum):
+    json = "json"
+    columnar = "columnar"
+    msgpack = "msgpack"
+    ndjson = "ndjson"
+
+
 class Location(BaseModel):
     type: str = Field("Point", title="Type", description="GeoJSON type")
     coordinates: List[float] = Field(None, title="Coordinates", description="longitude, latitude")
@@ -36,6 +43,25 @@ class Measure(BaseModel):
     pres: Pressure = Field(None, title="Pressure", description="Air pressure")
 
 
+class Aggregate(BaseModel):
+    min: float | None = Field(None, title="Min", description="Minimum value over the interval")
+    max: float | None = Field(None, title="Max", description="Maximum value over the interval")
+    avg: float | None = Field(None, title="Average", description="Average value over the interval")
+
+
+class MeasureAggregate(BaseModel):
+    id: int = Field(..., alias="_id", title="_ID", description="Interval start [unix timestamp]", example=1565722200)
+    w_dir: int = Field(
+        None, alias="w-dir", title="Wind direction", description="Circular mean of the wind direction [°] (0-359)"
+    )
+    w_avg: Aggregate = Field(None, alias="w-avg", title="Wind average", description="Wind speed [km/h]")
+    w_max: Aggregate = Field(None, alias="w-max", title="Wind max", description="Wind speed max [km/h]")
+    temp: Aggregate = Field(None, title="Temperature", description="Temperature [°C]")
+    hum: Aggregate = Field(None, title="Humidity", description="Air humidity [%rH]")
+    rain: Aggregate = Field(None, title="Rain", description="Rain [l/m²]")
+    pres: Pressure = Field(None, title="Pressure", description="Average air pressure")
+
+
 class MeasureKey(str, Enum):
     id = "_id"
     w_dir = "w-dir"
@@ -97,6 +123,60 @@ class Station(BaseModel):
     )
 
 
+class MarkerCluster(BaseModel):
+    loc: Location = Field(..., title="Location", description="Centroid of the stations [geoJSON point]")
+    count: int = Field(..., title="Count", description="Number of stations")
+    w_avg: float | None = Field(
+        None, alias="w-avg", title="Wind average", description="Highest wind average in the cluster [km/h]"
+    )
+    w_max: float | None = Field(
+        None, alias="w-max", title="Wind max", description="Highest wind max in the cluster [km/h]"
+    )
+    station: Station = Field(
+        ..., title="Station", description="Representative station: the one with the strongest wind average"
+    )
+
+
+class WindRoseSector(BaseModel):
+    dir: float = Field(..., title="Direction", description="Center of the direction sector [°]")
+    frequency: float = Field(..., title="Frequency", description="Fraction of the measures in the sector")
+    w_avg: float | None = Field(None, alias="w-avg", title="Wind average", description="Wind speed average [km/h]")
+    speeds: List[float] = Field(
+        ..., title="Speeds", description="Fraction of the measures in the sector by speed class (see 'speed-classes')"
+    )
+
+
+class WindStats(BaseModel):
+    since: int = Field(..., title="Since", description="Start of the window [unix timestamp]")
+    until: int = Field(..., title="Until", description="Last measure date [unix timestamp]")
+    count: int = Field(..., title="Count", description="Number of measures")
+    w_dir: float | None = Field(
+        None, alias="w-dir", title="Wind direction", description="Circular mean weighted by the wind speed [°] (0-359)"
+    )
+    w_dir_consistency: float | None = Field(
+        None,
+        alias="w-dir-consistency",
+        title="Wind direction consistency",
+        description="Length of the mean wind vector: 0 for a variable direction, 1 for a constant direction",
+    )
+    w_avg: Dict[str, float | None] = Field(
+        ..., alias="w-avg", title="Wind average", description="Percentiles of the wind speed, example: {'p50': 12.5}"
+    )
+    w_max: Dict[str, float | None] = Field(
+        ..., alias="w-max", title="Wind max", description="Percentiles of the wind speed max [km/h]"
+    )
+    gust_factor: float | None = Field(
+        None, alias="gust-factor", title="Gust factor", description="Average ratio of the wind max to the wind average"
+    )
+    calm: float | None = Field(None, title="Calm", description="Fraction of the measures without wind (< 1 km/h)")
+    speed_classes: List[float] = Field(
+        ..., alias="speed-classes", title="Speed classes", description="Lower bound of the speed classes [km/h]"
+    )
+    wind_rose: List[WindRoseSector] = Field(
+        ..., alias="wind-rose", title="Wind rose", description="Wind measures by direction sector"
+    )
+
+
 class StationKey(str, Enum):
     pv_id = "pv-id"
     pv_code = "pv-code"
@@ -137,3 +217,48 @@ station_key_defaults = [
     StationKey.last_rain,
     StationKey.last_pres,
 ]
+
+
+class StationsQuery(BaseModel):
+    limit: int = Field(20, description="Nb stations to return (max=500)")
+    keys: List[StationKey] = Field(station_key_defaults, description="List of keys to return")
+    provider: str = Field(None, description="Returns only stations of the given provider id. Limit is not enforced")
+    search: str = Field(None, description="String to search (ignoring accent)")
+    search_language: str = Field(
+        None, alias="search-language", description="Language of the search. Default to request language or 'en'"
+    )
+    near_latitude: float = Field(None, alias="near-lat", description="Geo search near: latitude ie 46.78")
+    near_longitude: float = Field(None, alias="near-lon", description="Geo search near: longitude ie 6.63")
+    near_distance: int = Field(
+        None, alias="near-distance", description="Geo search near: distance from lat,lon [meters]"
+    )
+    within_pt1_latitude: float = Field(
+        None, alias="within-pt1-lat", description="Geo search within rectangle: pt1 latitude"
+    )
+    within_pt1_longitude: float = Field(
+        None, alias="within-pt1-lon", description="Geo search within rectangle: pt1 longitude"
+    )
+    within_pt2_latitude: float = Field(
+        None, alias="within-pt2-lat", description="Geo search within rectangle: pt2 latitude"
+    )
+    within_pt2_longitude: float = Field(
+        None, alias="within-pt2-lon", description="Geo search within rectangle: pt2 longitude"
+    )
+    is_peak: bool = Field(
+        None, alias="is-peak", description="Return only the stations that are located on top of a peak"
+    )
+    status: Status = Field(
+        None, description="Return only the stations with the given status: 'green', 'orange' or 'red'"
+    )
+    last_measure: Union[int, datetime] = Field(
+        None,
+        alias="last-measure",
+        description="Return only the stations with a measure more recent that {last-measure}. "
+        "Can be a duration in seconds or a absolute datetime, for example: 2019-08-16 15:30",
+    )
+    is_highest_duplicates_rating: bool = Field(
+        None,
+        alias="is-highest-duplicates-rating",
+        description="Return only stations with the highest duplicates rating (filter stations at the same place)",
+    )
+    ids: List[str] = Field(None, description="Returns stations by ids")
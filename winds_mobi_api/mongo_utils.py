@@ -51,3 +51,101 @@ def generate_box_geometry(sw, ne):
         # http://docs.mongodb.org/manual/reference/operator/query/geometry/#op._S_geometry
         "crs": {"type": "name", "properties": {"name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}},
     }
+
+
+def tile_bounds(z, x, y):
+    """
+    tile_bounds returns the south-west and north-east corners of a web mercator (slippy map) tile.
+    https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+    """
+    n = math.pow(2, z)
+
+    def latitude(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    sw = [x / n * 360 - 180, latitude(y + 1)]
+    ne = [(x + 1) / n * 360 - 180, latitude(y)]
+    return sw, ne
+
+
+def get_value(document, path):
+    """
+    get_value returns the value of a dotted path (like `last._id`) in a document, or None when it doesn't exist.
+    """
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+query_operators = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+}
+
+
+def compile_query(query):
+    """
+    compile_query converts the `$in` operands to sets to match many documents with the same query.
+    """
+    compiled = {}
+    for path, condition in query.items():
+        if isinstance(condition, dict) and isinstance(condition.get("$in"), (list, tuple)):
+            try:
+                condition = {**condition, "$in": frozenset(condition["$in"])}
+            except TypeError:
+                # Unhashable values
+                pass
+        compiled[path] = condition
+    return compiled
+
+
+def match(document, query):
+    """
+    match evaluates a mongodb query against a document in memory. Only the operators in `query_operators` are
+    supported: $or, $regex or geo queries raise a KeyError.
+    """
+    for path, condition in query.items():
+        value = get_value(document, path)
+        if isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if not query_operators[operator](value, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(document, projection):
+    """
+    project applies an inclusion projection (like `{"name": 1, "last._id": 1}`) to a document in memory.
+    `_id` is always returned like mongodb does.
+    """
+    projected = {}
+    for path in ["_id", *projection]:
+        source = document
+        target = projected
+        *parents, key = path.split(".")
+        for parent in parents:
+            source = source.get(parent)
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(parent, {})
+        else:
+            if key in source:
+                target[key] = source[key]
+    return projected
+
+
+def to_columns(documents, paths):
+    """
+    to_columns converts a list of documents to one list of values per path (struct of arrays).
+    """
+    return {path: [get_value(document, path) for document in documents] for path in paths}
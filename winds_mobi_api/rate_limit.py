@@ -0,0 +1,147 @@
+import hashlib
+import heapq
+import logging
+import math
+import secrets
+import time
+from collections import OrderedDict
+
+from prometheus_client.core import GaugeMetricFamily
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from winds_mobi_api.metrics import get_route, rate_limit_requests
+from winds_mobi_api.settings import settings
+
+log = logging.getLogger(__name__)
+
+# Tokens consumed by a request of each route, the other routes (documentation, metrics) are not limited
+route_costs = {
+    "/stations/{station_id}/": 1,
+    "/stations/tiles/{z}/{x}/{y}/": 1,
+    "/stations/{station_id}/historic/": 2,
+    "/stations/{station_id}/stats/": 2,
+    "/stations/": 2,
+    "/stations/historic/": 5,
+    "/stations/clusters/": 5,
+    "/stations/live/": 5,
+    # Up to 20 searches
+    "/stations/batch/": 20,
+}
+# Box queries select their clusters value with several count_documents
+box_cost = 5
+# Clients are exported as salted digests: the IPs must not be published and the headers can be of any size. The digest
+# of a client is logged when it is first limited to be able to identify it.
+client_salt = secrets.token_bytes(16)
+
+
+def get_cost(scope: Scope, route):
+    cost = route_costs.get(route, 0)
+    if route == "/stations/" and b"within-pt1-lat=" in scope["query_string"]:
+        cost = box_cost
+    return cost
+
+
+def get_client(scope: Scope):
+    # The fair-use rules ask the clients to identify themselves with their user-agent and referer
+    headers = Headers(scope=scope)
+    ip = scope["client"][0] if scope.get("client") else ""
+    return ip, headers.get("user-agent", ""), headers.get("referer", "")
+
+
+def client_digest(client):
+    return hashlib.blake2b("\n".join(client).encode(), digest_size=6, key=client_salt).hexdigest()
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated", "cost", "limited")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.cost = 0
+        self.limited = 0
+
+
+class RateLimiter:
+    """
+    Token bucket per client: the buckets are refilled with `rate` tokens per second up to `burst` tokens. The least
+    recently seen clients are forgotten above `max_clients`.
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+
+    def acquire(self, client, cost):
+        """
+        Returns 0 if the request is allowed or the number of seconds to wait for enough tokens.
+        """
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = Bucket(self.burst, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            bucket.cost += cost
+            return 0
+        bucket.limited += 1
+        if bucket.limited == 1:
+            log.warning(f"Rate limiting client {client_digest(client)}: {client}")
+        return (cost - bucket.tokens) / self.rate
+
+    def collect(self, limit=20):
+        # Only the heaviest clients to bound the labels cardinality
+        buckets = heapq.nlargest(limit, self.buckets.items(), key=lambda item: item[1].cost)
+        cost = GaugeMetricFamily("rate_limit_client_cost", "Tokens consumed by the heaviest clients", labels=["client"])
+        limited = GaugeMetricFamily(
+            "rate_limit_client_limited", "Limited requests of the heaviest clients", labels=["client"]
+        )
+        for client, bucket in buckets:
+            cost.add_metric([client_digest(client)], bucket.cost)
+            limited.add_metric([client_digest(client)], bucket.limited)
+        yield cost
+        yield limited
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, rate_limiter: RateLimiter):
+        self.app = app
+        self.rate_limiter = rate_limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = get_route(scope)
+        cost = get_cost(scope, route)
+        if cost == 0:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.rate_limiter.acquire(get_client(scope), cost)
+        if retry_after:
+            rate_limit_requests.labels(route, "limited").inc()
+            response = JSONResponse(
+                {"detail": "Too many requests, please respect the fair-use rules"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+        rate_limit_requests.labels(route, "allowed").inc()
+        await self.app(scope, receive, send)
+
+
+rate_limiter = RateLimiter(settings.rate_limit_rate, settings.rate_limit_burst, settings.rate_limit_max_clients)
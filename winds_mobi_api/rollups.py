@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import logging
+
+import pymongo
+
+from winds_mobi_api.historic import rollup_pipeline
+
+log = logging.getLogger(__name__)
+
+# Rollup collections of each station, by resolution in seconds
+resolutions = {"hourly": 3600, "daily": 24 * 3600}
+
+
+def rollup_collection(station_id, name):
+    return f"{station_id}.{name}"
+
+
+def get_resolution(duration, bucket):
+    """
+    Returns the name and seconds of the coarsest rollup that can be aggregated by intervals of `bucket` seconds, or
+    None if `bucket` is smaller than all the resolutions. Without `bucket`, hourly values are returned up to 31 days
+    and daily values above.
+    """
+    if bucket is None:
+        name = "hourly" if duration <= 31 * 24 * 3600 else "daily"
+        return name, resolutions[name]
+    candidates = [(seconds, name) for name, seconds in resolutions.items() if seconds <= bucket]
+    if not candidates:
+        return None
+    seconds, name = max(candidates)
+    return name, seconds
+
+
+class RollupsUpdater:
+    """
+    Maintains the hourly and daily rollups of the stations incrementally: only the stations with new measures are
+    updated, from the start of their latest (possibly partial) interval.
+    """
+
+    def __init__(self):
+        self.last_times = {}
+
+    async def update_station(self, mongodb, station_id):
+        for name, resolution in resolutions.items():
+            collection = rollup_collection(station_id, name)
+            latest = await mongodb[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+            query = {"_id": {"$gte": latest["_id"]}} if latest else {}
+            await mongodb[station_id].aggregate(rollup_pipeline(query, resolution, collection)).to_list(None)
+
+    async def update(self, mongodb, concurrency, station_ids=None):
+        query = {"_id": {"$in": station_ids}} if station_ids else {}
+        stations = await mongodb.stations.find(query, {"last._id": 1}).to_list(None)
+        collection_names = set(await mongodb.list_collection_names())
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def update_station(station_id, last_time):
+            async with semaphore:
+                try:
+                    await self.update_station(mongodb, station_id)
+                    self.last_times[station_id] = last_time
+                except pymongo.errors.PyMongoError as e:
+                    log.error(f"Unable to update the rollups of '{station_id}': {e}")
+
+        updates = [
+            update_station(station["_id"], station["last"]["_id"])
+            for station in stations
+            if "last" in station
+            and station["_id"] in collection_names
+            and self.last_times.get(station["_id"]) != station["last"]["_id"]
+        ]
+        await asyncio.gather(*updates)
+        log.info(f"Rollups updated for {len(updates)} stations")
+
+    async def run(self, mongodb, interval, concurrency):
+        while True:
+            try:
+                await self.update(mongodb, concurrency)
+            except pymongo.errors.PyMongoError as e:
+                log.error(f"Unable to update the rollups: {e}")
+            await asyncio.sleep(interval)
+
+
+rollups_updater = RollupsUpdater()
+
+
+async def main(args):
+    from winds_mobi_api.database import mongodb
+
+    if args.interval:
+        await rollups_updater.run(mongodb(), args.interval, args.concurrency)
+    else:
+        await rollups_updater.update(mongodb(), args.concurrency, args.station_ids)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Update the hourly and daily rollups of the stations measures")
+    parser.add_argument("station_ids", nargs="*", help="Only update these stations")
+    parser.add_argument("--interval", type=int, help="Update the rollups every {interval} seconds")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of stations updated concurrently")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import re
+
+import pymongo
+
+from winds_mobi_api import diacritics
+from winds_mobi_api.snapshot import stations_snapshot
+
+log = logging.getLogger(__name__)
+
+word_separators = re.compile(r"\W+")
+
+
+def normalize(text):
+    return diacritics.normalize(text).lower()
+
+
+def trigrams(text):
+    return {"".join(chars) for chars in zip(text, text[1:], text[2:])}
+
+
+class SearchIndex:
+    """
+    Trigram index of the normalized (lower case, without accent) station `name` and `short` fields.
+
+    A word matches a station when it is contained in its name or short name, like the previous `$regex` queries.
+    """
+
+    def __init__(self):
+        self.ready = False
+
+    def load(self, stations):
+        ids = []
+        shorts = []
+        texts = []
+        tokens = []
+        postings = {}
+        for station in stations:
+            text = normalize(f"{station.get('name') or ''}\n{station.get('short') or ''}")
+            position = len(ids)
+            ids.append(station["_id"])
+            shorts.append(station.get("short") or "")
+            texts.append(text)
+            tokens.append(f" {word_separators.sub(' ', text)}")
+            for trigram in trigrams(text):
+                postings.setdefault(trigram, []).append(position)
+
+        self.ids = ids
+        self.shorts = shorts
+        self.texts = texts
+        self.tokens = tokens
+        self.postings = {trigram: set(positions) for trigram, positions in postings.items()}
+        self.ready = True
+
+    async def refresh(self, mongodb):
+        if stations_snapshot.ready:
+            stations = list(stations_snapshot.stations.values())
+        else:
+            stations = await mongodb.stations.find({}, {"name": 1, "short": 1}).to_list(None)
+        self.load(stations)
+
+    async def run(self, mongodb, interval):
+        while True:
+            try:
+                await self.refresh(mongodb)
+            except pymongo.errors.PyMongoError as e:
+                log.error(f"Unable to refresh the search index: {e}")
+            await asyncio.sleep(interval)
+
+    def candidates(self, word):
+        if len(word) < 3:
+            return range(len(self.ids))
+        postings = sorted((self.postings.get(trigram, set()) for trigram in trigrams(word)), key=len)
+        return postings[0].intersection(*postings[1:])
+
+    def search(self, words):
+        """
+        Returns the ids of the stations matching at least one word, ranked by number of matching words, then by
+        number of words matching the beginning of a word and then by short name.
+        """
+        scores = {}
+        for word in {normalize(word) for word in words}:
+            for position in self.candidates(word):
+                if word in self.texts[position]:
+                    matches, prefixes = scores.get(position, (0, 0))
+                    scores[position] = (matches + 1, prefixes + (f" {word}" in self.tokens[position]))
+
+        positions = sorted(
+            scores, key=lambda position: (-scores[position][0], -scores[position][1], self.shorts[position])
+        )
+        return [self.ids[position] for position in positions]
+
+
+search_index = SearchIndex()
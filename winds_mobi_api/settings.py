@@ -6,13 +6,57 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     environment: str = "local"
+    host: str = "127.0.0.1"
     port: int = 8000
+    # 0: one worker per core
+    workers: int = 1
     mongodb_url: str
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 10
+    mongodb_connect_timeout_ms: int = 20000
+    mongodb_server_selection_timeout_ms: int = 30000
+    mongodb_wait_queue_timeout_ms: Optional[int] = None
+    mongodb_check_indexes: bool = True
+    mongodb_create_indexes: bool = False
+    # 0: disabled
+    slow_query_threshold_ms: int = 500
+    slow_query_sample_rate: float = 0.1
     root_path: str
     log_config_path: Optional[str] = str(Path(Path(__file__).parents[0], "logging.yaml"))
     sentry_url: Optional[str] = None
     doc_path: str = "doc"
     response_schema_validation: bool = False
+    # Validates this fraction of the responses in the background when response_schema_validation is disabled
+    response_schema_validation_sample_rate: float = 0.0
+    stations_snapshot: bool = False
+    stations_snapshot_change_stream: bool = True
+    stations_snapshot_poll_interval: int = 10
+    # Seconds waited for the snapshot on startup, the requests are then served from mongodb until it is loaded
+    stations_snapshot_load_timeout: float = 30
+    stations_index: bool = False
+    stations_index_refresh_interval: int = 60
+    search_index: bool = True
+    search_index_refresh_interval: int = 60
+    historic_concurrency: int = 10
+    tile_stations: int = 100
+    tile_cache_ttl: int = 60
+    live_max_subscribers: int = 10000
+    live_keepalive_interval: int = 15
+    coalescing: bool = True
+    coalescing_cache_ttl: float = 0.5
+    cache_url: Optional[str] = None
+    cache_max_size: int = 10000
+    compression: bool = True
+    compression_min_size: int = 1000
+    # Maximum size in bytes of the compressed bodies kept by each worker
+    compression_cache_size: int = 64 * 1024 * 1024
+    metrics: bool = True
+    rate_limit: bool = False
+    # Tokens per second and bucket size of each client, a request costs from 1 to 5 tokens depending on its route.
+    # The buckets are kept by each worker: a client spreading its requests gets up to {workers} times these values.
+    rate_limit_rate: float = 10
+    rate_limit_burst: int = 100
+    rate_limit_max_clients: int = 100000
 
 
 settings = Settings()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import random
+
+import pymongo
+from pymongo import monitoring
+
+from winds_mobi_api.settings import settings
+
+log = logging.getLogger(__name__)
+
+explainable_commands = {"find", "aggregate", "count", "distinct"}
+
+
+def get_winning_plan(explain):
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            return explain["winningPlan"]
+        values = explain.values()
+    elif isinstance(explain, list):
+        values = explain
+    else:
+        return None
+    for value in values:
+        plan = get_winning_plan(value)
+        if plan is not None:
+            return plan
+    return None
+
+
+def plan_stages(plan):
+    """
+    Summary of a query plan, like `FETCH <- IXSCAN loc_2dsphere`.
+    """
+    stage = plan.get("stage", "?")
+    if "indexName" in plan:
+        stage = f"{stage} {plan['indexName']}"
+    inputs = plan.get("inputStages") or ([plan["inputStage"]] if "inputStage" in plan else [])
+    if plan.get("queryPlan"):
+        # Slot based execution engine
+        inputs = [plan["queryPlan"]]
+    if not inputs:
+        return stage
+    return f"{stage} <- {', '.join(plan_stages(input) for input in inputs)}"
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Samples the commands slower than `threshold_ms` and logs their query plan. The plans are explained by a
+    background task to not slow the requests down.
+    """
+
+    def __init__(self, threshold_ms, sample_rate):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.commands = {}
+        self.loop = None
+        self.queue = None
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in explainable_commands and self.loop is not None:
+            self.commands[event.request_id] = (event.database_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        database_name, command = self.commands.pop(event.request_id, (None, None))
+        duration_ms = event.duration_micros / 1000
+        if command is None or duration_ms < self.threshold_ms or random.random() >= self.sample_rate:
+            return
+        # Called from the motor executor threads
+        self.loop.call_soon_threadsafe(self.put, (database_name, command, duration_ms))
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self.commands.pop(event.request_id, None)
+
+    def put(self, query):
+        if not self.queue.full():
+            self.queue.put_nowait(query)
+
+    async def explain(self, client, database_name, command, duration_ms):
+        # Remove the session and cluster fields added by the driver
+        command = {key: value for key, value in command.items() if not key.startswith("$") and key != "lsid"}
+        explain = await client[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+        plan = get_winning_plan(explain)
+        command_name = next(iter(command))
+        log.warning(
+            f"Slow {command_name} on '{command[command_name]}' ({duration_ms:.0f} ms): "
+            f"{plan_stages(plan) if plan else 'unknown plan'}, command: {command}"
+        )
+
+    async def run(self, client):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=100)
+        while True:
+            database_name, command, duration_ms = await self.queue.get()
+            try:
+                await self.explain(client, database_name, command, duration_ms)
+            except pymongo.errors.PyMongoError as e:
+                log.error(f"Unable to explain a slow query: {e}")
+
+
+slow_query_listener = SlowQueryListener(settings.slow_query_threshold_ms, settings.slow_query_sample_rate)
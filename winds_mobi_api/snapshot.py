@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+import pymongo
+
+from winds_mobi_api.mongo_utils import compile_query, get_value, match, project
+
+log = logging.getLogger(__name__)
+
+# https://www.mongodb.com/docs/manual/reference/error-codes/: "$changeStream stage is only supported on replica sets"
+CHANGE_STREAM_NOT_SUPPORTED = 40573
+
+
+class StationsSnapshot:
+    """
+    In-memory copy of the `stations` collection. It is kept current by tailing a change stream, or by reloading the
+    whole collection periodically when change streams are not available (standalone mongodb or a local stand-in).
+    """
+
+    def __init__(self):
+        self.stations = {}
+        self.providers = {}
+        self.loaded = asyncio.Event()
+        # Called with the station document when its last measure changes
+        self.listeners = []
+
+    @property
+    def ready(self):
+        return self.loaded.is_set()
+
+    async def load(self, mongodb):
+        stations = {}
+        providers = {}
+        async for station in mongodb.stations.find():
+            stations[station["_id"]] = station
+            providers.setdefault(station.get("pv-code"), {})[station["_id"]] = station
+        if self.listeners:
+            for station in stations.values():
+                self.notify(self.stations.get(station["_id"]), station)
+        self.stations = stations
+        self.providers = providers
+        self.loaded.set()
+        log.info(f"Stations snapshot loaded: {len(stations)} stations")
+
+    def notify(self, previous, station):
+        if get_value(previous, "last._id") != get_value(station, "last._id"):
+            for listener in self.listeners:
+                listener(station)
+
+    def put(self, station):
+        previous = self.stations.get(station["_id"])
+        if previous:
+            self.providers.get(previous.get("pv-code"), {}).pop(station["_id"], None)
+        self.stations[station["_id"]] = station
+        self.providers.setdefault(station.get("pv-code"), {})[station["_id"]] = station
+        self.notify(previous, station)
+
+    def delete(self, station_id):
+        station = self.stations.pop(station_id, None)
+        if station:
+            self.providers.get(station.get("pv-code"), {}).pop(station_id, None)
+
+    def apply(self, change):
+        if change["operationType"] in ("insert", "update", "replace"):
+            if change.get("fullDocument"):
+                self.put(change["fullDocument"])
+            else:
+                # The document was deleted before the update lookup
+                self.delete(change["documentKey"]["_id"])
+        elif change["operationType"] == "delete":
+            self.delete(change["documentKey"]["_id"])
+
+    async def watch(self, mongodb):
+        async with mongodb.stations.watch(full_document="updateLookup") as stream:
+            # Load the collection once the stream is opened to not miss any change
+            await self.load(mongodb)
+            async for change in stream:
+                self.apply(change)
+
+    async def poll(self, mongodb, interval):
+        while True:
+            await self.load(mongodb)
+            await asyncio.sleep(interval)
+
+    async def run(self, mongodb, change_stream, poll_interval):
+        while True:
+            try:
+                if change_stream:
+                    await self.watch(mongodb)
+                else:
+                    await self.poll(mongodb, poll_interval)
+            except pymongo.errors.PyMongoError as e:
+                if isinstance(e, pymongo.errors.OperationFailure) and e.code == CHANGE_STREAM_NOT_SUPPORTED:
+                    log.warning("Change streams are not supported by mongodb, polling the stations collection instead")
+                    change_stream = False
+                    continue
+                log.error(f"Unable to update the stations snapshot: {e}")
+                await asyncio.sleep(poll_interval)
+
+    def get(self, station_id, projection):
+        station = self.stations.get(station_id)
+        if station:
+            return project(station, projection)
+
+    def find(self, query, projection, sort=None, limit=None):
+        if "_id" in query:
+            stations = [self.stations[id] for id in dict.fromkeys(query["_id"]["$in"]) if id in self.stations]
+        elif "pv-code" in query:
+            stations = self.providers.get(query["pv-code"], {}).values()
+        else:
+            stations = self.stations.values()
+        compiled_query = compile_query(query)
+        stations = [station for station in stations if match(station, compiled_query)]
+        if sort:
+            # Same order as mongodb: missing values first
+            stations.sort(key=lambda station: (station.get(sort) is not None, station.get(sort) or ""))
+        if limit:
+            stations = stations[:limit]
+        return [project(station, projection) for station in stations]
+
+
+stations_snapshot = StationsSnapshot()
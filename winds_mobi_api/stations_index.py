@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from enum import Enum
+
+import numpy as np
+import pymongo
+from scipy.spatial import cKDTree
+
+from winds_mobi_api.mongo_utils import LAT, LNG, get_value
+from winds_mobi_api.snapshot import stations_snapshot
+
+log = logging.getLogger(__name__)
+
+# Station fields that can be filtered in memory
+numeric_paths = ["last._id", "last.w-avg", "last.w-max"]
+indexed_paths = ["status", "peak", "pv-code", "duplicates.is_highest_rating", *numeric_paths]
+# Radius used by mongodb for the GeoJSON distances
+earth_radius = 6378100
+
+
+def to_unit_sphere(lon, lat):
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def plain_value(value):
+    # numpy doesn't compare the str enums (like Status) with strings
+    return value.value if isinstance(value, Enum) else value
+
+
+def column_mask(column, condition):
+    if isinstance(condition, dict):
+        mask = np.ones(len(column), dtype=bool)
+        for operator, operand in condition.items():
+            operand = [plain_value(value) for value in operand] if operator == "$in" else plain_value(operand)
+            if operator == "$eq":
+                mask &= column == operand
+            elif operator == "$ne":
+                mask &= column != operand
+            elif operator == "$gt":
+                mask &= column > operand
+            elif operator == "$gte":
+                mask &= column >= operand
+            elif operator == "$lt":
+                mask &= column < operand
+            elif operator == "$lte":
+                mask &= column <= operand
+            elif operator == "$in":
+                mask &= np.isin(column, list(operand))
+            else:
+                return None
+        return mask
+    return column == plain_value(condition)
+
+
+class StationsIndex:
+    """
+    Columnar in-memory index of the station locations, `clusters` values and filtered fields. It is used to pick the
+    `clusters` threshold of a bounding box query without counting documents in mongodb, and to find the nearest
+    stations with a KD-tree of the locations on the unit sphere.
+    """
+
+    def __init__(self):
+        self.ready = False
+
+    def load(self, stations, save_clusters):
+        ids = []
+        locations = []
+        clusters = []
+        columns = {path: [] for path in indexed_paths}
+        for station in stations:
+            coordinates = get_value(station, "loc.coordinates")
+            if not coordinates:
+                continue
+            ids.append(station["_id"])
+            locations.append(coordinates[:2])
+            clusters.append(min(station["clusters"]) if station.get("clusters") else np.nan)
+            for path in indexed_paths:
+                columns[path].append(get_value(station, path))
+
+        locations = np.array(locations, dtype=float).reshape(-1, 2)
+        self.ids = np.array(ids, dtype=object)
+        self.lon = locations[:, LNG]
+        self.lat = locations[:, LAT]
+        self.clusters = np.array(clusters, dtype=float)
+        self.tree = cKDTree(to_unit_sphere(self.lon, self.lat))
+        self.columns = {path: np.array(values, dtype=object) for path, values in columns.items()}
+        for path in numeric_paths:
+            # Missing values are NaN to never match comparison operators, like mongodb
+            self.columns[path] = np.array([np.nan if value is None else value for value in columns[path]], dtype=float)
+        self.cluster_min = save_clusters["min"]
+        self.cluster_max = save_clusters["max"]
+        self.ready = True
+
+    async def refresh(self, mongodb):
+        if stations_snapshot.ready:
+            stations = list(stations_snapshot.stations.values())
+        else:
+            projection = {"loc": 1, "clusters": 1, **{path: 1 for path in indexed_paths}}
+            stations = await mongodb.stations.find({}, projection).to_list(None)
+        save_clusters = await mongodb.stations_clusters.find_one("save_clusters")
+        self.load(stations, save_clusters)
+
+    async def run(self, mongodb, interval):
+        while True:
+            try:
+                await self.refresh(mongodb)
+            except pymongo.errors.PyMongoError as e:
+                log.error(f"Unable to refresh the stations index: {e}")
+            await asyncio.sleep(interval)
+
+    def mask(self, query):
+        """
+        Returns the stations matching a mongodb query, or None if the query can't be evaluated in memory.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for path, condition in query.items():
+            if path == "_id":
+                column = self.ids
+            elif path in self.columns:
+                column = self.columns[path]
+            else:
+                return None
+            condition_mask = column_mask(column, condition)
+            if condition_mask is None:
+                return None
+            mask &= condition_mask
+        return mask
+
+    def within(self, sw, ne):
+        """
+        Flat approximation of `generate_box_geometry(sw, ne)`.
+        """
+        return (
+            (self.lon >= min(sw[LNG], ne[LNG]))
+            & (self.lon <= max(sw[LNG], ne[LNG]))
+            & (self.lat >= min(sw[LAT], ne[LAT]))
+            & (self.lat <= max(sw[LAT], ne[LAT]))
+        )
+
+    def select_cluster(self, mask, limit):
+        """
+        Returns the highest `clusters` value that selects at most `limit` stations, or None if all the stations can be
+        returned.
+        """
+        if np.count_nonzero(mask) <= limit:
+            return None
+        clusters = np.sort(self.clusters[mask & ~np.isnan(self.clusters)])
+        if len(clusters) <= limit:
+            return int(self.cluster_max)
+        return max(int(np.ceil(clusters[limit])) - 1, int(self.cluster_min))
+
+    def nearest(self, lon, lat, mask, limit, max_distance=None):
+        """
+        Returns the ids of the `limit` nearest stations selected by `mask`, sorted by distance like a `$near` query.
+        `max_distance` is in meters.
+        """
+        count = np.count_nonzero(mask)
+        if count == 0:
+            return []
+        point = to_unit_sphere(lon, lat)
+        # Chord length of the great circle distance
+        upper_bound = 2 * np.sin(min(max_distance / earth_radius, np.pi) / 2) if max_distance is not None else np.inf
+        k = min(limit, count)
+        while True:
+            # Query more neighbours until enough of them are selected by the mask
+            _, positions = self.tree.query(point, k=min(k, len(self.ids)), distance_upper_bound=upper_bound)
+            positions = np.atleast_1d(positions)
+            found = positions < len(self.ids)
+            positions = positions[found]
+            selected = positions[mask[positions]]
+            if len(selected) >= limit or k >= len(self.ids) or not found.all():
+                return self.ids[selected[:limit]].tolist()
+            k *= 4
+
+
+stations_index = StationsIndex()
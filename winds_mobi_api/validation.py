@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import random
+from urllib.parse import parse_qs
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from winds_mobi_api.metrics import response_validations
+
+log = logging.getLogger(__name__)
+
+type_adapters = {}
+
+
+def get_type_adapter(route):
+    # Building a TypeAdapter compiles the validator: only once per route
+    if route.unique_id not in type_adapters:
+        type_adapters[route.unique_id] = TypeAdapter(route.response_model)
+    return type_adapters[route.unique_id]
+
+
+def validate(type_adapter, body, path):
+    try:
+        type_adapter.validate_python(orjson.loads(body))
+    except ValidationError as e:
+        response_validations.labels(path, "invalid").inc()
+        log.warning(f"Response of '{path}' doesn't match its schema ({e.error_count()} errors): {e.errors()[:3]}")
+    else:
+        response_validations.labels(path, "valid").inc()
+
+
+class ValidationMiddleware:
+    """
+    Validates a sample of the JSON responses with the `response_model` of their route. The validation runs in a
+    thread once the response is sent.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+        content_type = b""
+        chunks = []
+
+        async def send_wrapper(message: Message):
+            nonlocal status, content_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+            elif message["type"] == "http.response.body" and content_type.startswith(b"application/json"):
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        route = scope.get("route")
+        # The columnar formats don't follow the response model
+        format = parse_qs(scope["query_string"].decode()).get("format", ["json"])[-1]
+        if status == 200 and format == "json" and chunks and getattr(route, "response_model", None) is not None:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, validate, get_type_adapter(route), b"".join(chunks), route.path)
@@ -1,50 +1,100 @@
+import asyncio
 import logging
+import math
 from datetime import datetime
-from typing import Annotated, List, Union
+from typing import Annotated, Dict, List, Union
 
+import msgpack
 import numpy as np
+import orjson
 import pymongo
-from aiocache import cached
-from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query
-from fastapi.responses import ORJSONResponse
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Path, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from scipy.stats import linregress
-from stop_words import StopWordError, get_stop_words
+from starlette.requests import Request
 
 from winds_mobi_api import diacritics
+from winds_mobi_api.cache import cached
+from winds_mobi_api.conditional import check_conditional_request
 from winds_mobi_api.database import mongodb
-from winds_mobi_api.language import negotiate_language
+from winds_mobi_api.historic import aggregate_paths, aggregate_pipeline, columns_pipeline, rollup_aggregate_pipeline
+from winds_mobi_api.language import negotiate_language, remove_stop_words
+from winds_mobi_api.live import Subscriber, live_updates
+from winds_mobi_api.markers import cluster_markers
+from winds_mobi_api.metrics import cluster_selection_duration
 from winds_mobi_api.models import (
+    Format,
+    MarkerCluster,
     Measure,
+    MeasureAggregate,
     MeasureKey,
     Station,
     StationKey,
+    StationsQuery,
     Status,
+    WindStats,
     measure_key_defaults,
     station_key_defaults,
 )
-from winds_mobi_api.mongo_utils import generate_box_geometry
+from winds_mobi_api.mongo_utils import generate_box_geometry, get_value, project, tile_bounds, to_columns
+from winds_mobi_api.rollups import get_resolution, resolutions, rollup_collection
+from winds_mobi_api.search import search_index
 from winds_mobi_api.settings import settings
+from winds_mobi_api.snapshot import stations_snapshot
+from winds_mobi_api.stations_index import stations_index
+from winds_mobi_api.wind_stats import wind_stats
 
 log = logging.getLogger(__name__)
 router = APIRouter()
 
+max_historic_ids = 100
+max_batch_queries = 20
+max_historic_duration = 7 * 24 * 3600
+max_rollup_duration = 366 * 24 * 3600
+max_tile_zoom = 20
+max_stats_percentiles = 10
+ndjson_batch_size = 500
 
-@cached(ttl=10 * 60)
+
+@cached(ttl=10 * 60, stale_ttl=60 * 60, refresh_ahead=0.8)
 async def get_collection_names(mongodb):
     return await mongodb.list_collection_names()
 
 
-@cached(ttl=10 * 60)
+@cached(ttl=10 * 60, stale_ttl=60 * 60, refresh_ahead=0.8)
 async def get_save_clusters(mongodb):
     return await mongodb.stations_clusters.find_one("save_clusters")
 
 
-def response(data):
-    if settings.response_schema_validation:
+def encode_ndjson(documents):
+    return b"".join(orjson.dumps(document) + b"\n" for document in documents)
+
+
+async def stream_ndjson(cursor):
+    while documents := await cursor.to_list(ndjson_batch_size):
+        yield encode_ndjson(documents)
+
+
+async def cursor_response(cursor, format: Format, paths: List[str], headers: Dict[str, str] = None):
+    """
+    Streams the cursor batches with the ndjson format instead of loading all the documents in memory.
+    """
+    if format == Format.ndjson:
+        return StreamingResponse(stream_ndjson(cursor), 200, headers, media_type="application/x-ndjson")
+    return response(await cursor.to_list(None), format, paths, headers)
+
+
+def response(data, format: Format = Format.json, paths: List[str] = None, headers: Dict[str, str] = None):
+    if format == Format.columnar:
+        return ORJSONResponse(to_columns(data, paths), 200, headers)
+    elif format == Format.msgpack:
+        return Response(msgpack.packb(to_columns(data, paths)), 200, headers, media_type="application/vnd.msgpack")
+    elif format == Format.ndjson:
+        return Response(encode_ndjson(data), 200, headers, media_type="application/x-ndjson")
+    elif settings.response_schema_validation:
         return data
     else:
-        return ORJSONResponse(data, 200)
+        return ORJSONResponse(data, 200, headers)
 
 
 def check_latitude_longitude(latitude: float, longitude: float):
@@ -58,9 +108,513 @@ def check_latitude_longitude(latitude: float, longitude: float):
         raise HTTPException(status_code=400, detail=message)
 
 
+def get_historic_bucket(
+    duration: int, bucket: int | None, points: int | None, max_duration: int = max_historic_duration
+):
+    if duration > max_duration:
+        raise HTTPException(status_code=400, detail=f"Duration > {max_duration // (24 * 3600)} days")
+    if bucket is not None and points is not None:
+        raise HTTPException(status_code=400, detail="Only one of bucket or points can be given")
+    if points is not None:
+        if points < 1:
+            raise HTTPException(status_code=400, detail="Points < 1")
+        bucket = max(math.ceil(duration / points), 1)
+    if bucket is not None and bucket < 1:
+        raise HTTPException(status_code=400, detail="Bucket < 1")
+    return bucket
+
+
+def get_historic_cursor(
+    mongodb, station_id: str, query: dict, keys: List[MeasureKey], bucket: int | None, limit: int | None = None
+):
+    if bucket:
+        pipeline = aggregate_pipeline(query, bucket, keys)
+        if limit:
+            pipeline.append({"$limit": limit})
+        return mongodb[station_id].aggregate(pipeline)
+    projection_dict = {}
+    for key in keys:
+        projection_dict[key.value] = 1
+    cursor = mongodb[station_id].find(query, projection_dict, sort=(("_id", -1),))
+    if limit:
+        cursor.limit(limit)
+    return cursor
+
+
+def get_rollup_cursor(
+    mongodb, collection: str, resolution: int, query: dict, keys: List[MeasureKey], bucket: int, limit: int | None
+):
+    if bucket == resolution:
+        projection_dict = {}
+        for key in keys:
+            projection_dict[key.value] = 1
+        cursor = mongodb[collection].find(query, projection_dict, sort=(("_id", -1),))
+        if limit:
+            cursor.limit(limit)
+        return cursor
+    pipeline = rollup_aggregate_pipeline(query, bucket, keys)
+    if limit:
+        pipeline.append({"$limit": limit})
+    return mongodb[collection].aggregate(pipeline)
+
+
+def get_cluster_query(query: dict, cluster: int):
+    return {**query, "clusters": {"$elemMatch": {"$lte": cluster}}}
+
+
+async def find_box_stations(mongodb, query: dict, sw, ne, limit: int, projection_dict: dict):
+    """
+    Returns the stations within the box, thinned by their `clusters` value to about `limit` stations.
+    """
+    index_mask = stations_index.mask(query) if stations_index.ready else None
+    query = {**query, "loc": {"$geoWithin": {"$geometry": generate_box_geometry(sw, ne)}}}
+
+    if index_mask is not None:
+        with cluster_selection_duration.labels("index").time():
+            cluster = stations_index.select_cluster(index_mask & stations_index.within(sw, ne), limit)
+    else:
+        cluster = await select_cluster(mongodb, query, limit)
+
+    if cluster:
+        cursor = mongodb.stations.find(get_cluster_query(query, cluster), projection_dict)
+    else:
+        cursor = mongodb.stations.find(query, projection_dict)
+    return await cursor.to_list(None)
+
+
+async def select_cluster(mongodb, query: dict, limit: int):
+    """
+    Estimates the `clusters` value that selects about `limit` stations by counting the stations of 3 values.
+    """
+    with cluster_selection_duration.labels("mongodb").time():
+        save_cluster = await get_save_clusters(mongodb)
+        cluster_min = save_cluster["min"]
+        cluster_max = save_cluster["max"]
+        x = [x for x in np.linspace(cluster_min, cluster_max, 3)]
+        y = [await mongodb.stations.count_documents(get_cluster_query(query, int(cluster))) for cluster in x]
+        slope, intercept = np.polyfit(x, y, 1)
+        cluster_value = (limit - intercept) / slope
+        cluster_value = max(cluster_value, cluster_min)
+        if cluster_value <= cluster_max:
+            return int(cluster_value)
+        return None
+
+
+# The key contains the last measure time: new measures are computed on the next request
+@cached(ttl=60 * 60)
+async def get_wind_stats(mongodb, station_id: str, last_time: int, duration: int, sectors: int, percentiles: list):
+    query = {"_id": {"$gte": last_time - duration}}
+    keys = [MeasureKey.w_dir, MeasureKey.w_avg, MeasureKey.w_max]
+    columns = await mongodb[station_id].aggregate(columns_pipeline(query, keys)).to_list(None)
+    values = [columns[0][key.value] if columns else [] for key in keys]
+    return {"since": last_time - duration, "until": last_time, **wind_stats(*values, sectors, percentiles)}
+
+
+@cached(ttl=settings.tile_cache_ttl, stale_ttl=settings.tile_cache_ttl)
+async def get_tile_stations(mongodb, z: int, x: int, y: int, keys: List[str]):
+    projection_dict = {}
+    for key in keys:
+        projection_dict[key] = 1
+    # last._id should be always returned
+    projection_dict["last._id"] = 1
+
+    now = datetime.now().timestamp()
+    query = {"status": {"$ne": "hidden"}, "last._id": {"$gt": now - 30 * 24 * 3600}}
+    sw, ne = tile_bounds(z, x, y)
+    return await find_box_stations(mongodb, query, sw, ne, settings.tile_stations, projection_dict)
+
+
+format_query = Query(
+    Format.json,
+    description="Response format: 'json', 'columnar' (one array per key), 'msgpack' (columnar in MessagePack) or "
+    "'ndjson' (streamed, one document per line)",
+)
+
 error_detail_doc = {"application/json": {"schema": {"type": "object", "properties": {"detail": {"type": "string"}}}}}
 
 
+# Must be registered before "/stations/{station_id}/"
+@router.get(
+    "/stations/historic/",
+    status_code=200,
+    response_model=Dict[str, Union[List[Measure], List[MeasureAggregate]]],
+    summary="Get historic data for multiple stations since a duration",
+    response_class=ORJSONResponse,
+    description="""
+Returns the historic data by station id. Stations without historic data are not returned.
+
+Example:
+
+- Historic Le Suchet and Mont Tendre (1 hour): [stations/historic/?ids=holfuy-1636&ids=holfuy-1293&duration=3600](stations/historic/?ids=holfuy-1636&ids=holfuy-1293&duration=3600)
+""",  # noqa: E501
+    responses={400: {"description": "Bad request", "content": {**error_detail_doc}}},
+)
+async def find_stations_historic(
+    mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
+    ids: List[str] = Query(..., description=f"Station ids (max={max_historic_ids})"),
+    duration: int = Query(3600, description="Historic duration"),
+    keys: List[MeasureKey] = Query(measure_key_defaults, description="List of keys to return"),
+    bucket: int = Query(
+        None, description="Aggregate the measures by intervals of {bucket} seconds: min/max/avg of the values"
+    ),
+    points: int = Query(None, description="Aggregate the measures in about {points} intervals"),
+):
+    if len(ids) > max_historic_ids:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max={max_historic_ids})")
+    bucket = get_historic_bucket(duration, bucket, points)
+
+    query = {"_id": {"$in": ids}}
+    if stations_snapshot.ready:
+        stations = stations_snapshot.find(query, {"last._id": 1})
+    else:
+        stations = await mongodb.stations.find(query, {"last._id": 1}).to_list(None)
+    collection_names = await get_collection_names(mongodb)
+    last_times = {
+        station["_id"]: station["last"]["_id"]
+        for station in stations
+        if "last" in station and station["_id"] in collection_names
+    }
+
+    semaphore = asyncio.Semaphore(settings.historic_concurrency)
+
+    async def get_historic(station_id: str):
+        async with semaphore:
+            query = {"_id": {"$gte": last_times[station_id] - duration}}
+            return await get_historic_cursor(mongodb, station_id, query, keys, bucket).to_list(None)
+
+    station_ids = [station_id for station_id in dict.fromkeys(ids) if station_id in last_times]
+    historics = await asyncio.gather(*[get_historic(station_id) for station_id in station_ids])
+    return response(dict(zip(station_ids, historics)))
+
+
+# Must be registered before "/stations/{station_id}/"
+@router.get(
+    "/stations/live/",
+    status_code=200,
+    summary="Stream the new measures of stations",
+    response_class=StreamingResponse,
+    description="""
+[Server-sent events](https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events) stream of the stations
+selected by ids, provider or rectangle: a `station` event is sent each time a station has a new measure. Slow clients
+only receive the latest update of each station.
+
+Example:
+- Live updates of Le Suchet: [stations/live/?ids=holfuy-1636](stations/live/?ids=holfuy-1636)
+""",  # noqa: E501
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        400: {"description": "Bad request", "content": {**error_detail_doc}},
+        503: {"description": "Live updates are not available", "content": {**error_detail_doc}},
+    },
+)
+async def stream_stations(
+    keys: List[StationKey] = Query(station_key_defaults, description="List of keys to return"),
+    provider: str = Query(None, description="Stream the stations of the given provider id"),
+    within_pt1_latitude: float = Query(None, alias="within-pt1-lat", description="Rectangle: pt1 latitude"),
+    within_pt1_longitude: float = Query(None, alias="within-pt1-lon", description="Rectangle: pt1 longitude"),
+    within_pt2_latitude: float = Query(None, alias="within-pt2-lat", description="Rectangle: pt2 latitude"),
+    within_pt2_longitude: float = Query(None, alias="within-pt2-lon", description="Rectangle: pt2 longitude"),
+    ids: List[str] = Query(None, description="Stream the stations by ids"),
+):
+    if not stations_snapshot.ready:
+        raise HTTPException(status_code=503, detail="Live updates are not enabled")
+    if len(live_updates) >= settings.live_max_subscribers:
+        raise HTTPException(status_code=503, detail="Too many live updates subscribers")
+
+    box = None
+    if (
+        within_pt1_latitude is not None
+        and within_pt1_longitude is not None
+        and within_pt2_latitude is not None
+        and within_pt2_longitude is not None
+    ):
+        check_latitude_longitude(within_pt1_latitude, within_pt1_longitude)
+        check_latitude_longitude(within_pt2_latitude, within_pt2_longitude)
+        box = (
+            (min(within_pt1_longitude, within_pt2_longitude), min(within_pt1_latitude, within_pt2_latitude)),
+            (max(within_pt1_longitude, within_pt2_longitude), max(within_pt1_latitude, within_pt2_latitude)),
+        )
+    if not ids and not provider and not box:
+        raise HTTPException(status_code=400, detail="ids, provider or rectangle is required")
+
+    projection_dict = {}
+    for key in keys:
+        projection_dict[key.value] = 1
+    # last._id should be always returned
+    projection_dict["last._id"] = 1
+
+    subscriber = Subscriber(ids=ids or None, provider=provider, box=box)
+
+    async def events():
+        live_updates.subscribe(subscriber)
+        try:
+            while True:
+                stations = await subscriber.get_updates(settings.live_keepalive_interval)
+                if stations:
+                    yield b"".join(
+                        b"event: station\ndata: " + orjson.dumps(project(station, projection_dict)) + b"\n\n"
+                        for station in stations
+                    )
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            live_updates.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Must be registered before "/stations/{station_id}/"
+@router.get(
+    "/stations/clusters/",
+    status_code=200,
+    response_model=List[MarkerCluster],
+    summary="Get clusters of stations for a map view",
+    response_class=ORJSONResponse,
+    description="""
+Groups the stations within a rectangle by cells of a grid that depends on the zoom level (about 64px at this zoom).
+
+Example:
+- Clusters of the Jura mountains at zoom 8: [stations/clusters/?zoom=8&within-pt1-lat=47.6&within-pt1-lon=7.9&within-pt2-lat=45.5&within-pt2-lon=4.5](stations/clusters/?zoom=8&within-pt1-lat=47.6&within-pt1-lon=7.9&within-pt2-lat=45.5&within-pt2-lon=4.5)
+""",  # noqa: E501
+    responses={400: {"description": "Bad request", "content": {**error_detail_doc}}},
+)
+async def find_station_clusters(
+    mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
+    zoom: int = Query(..., description=f"Map zoom level (max={max_tile_zoom})"),
+    within_pt1_latitude: float = Query(..., alias="within-pt1-lat", description="Rectangle: pt1 latitude"),
+    within_pt1_longitude: float = Query(..., alias="within-pt1-lon", description="Rectangle: pt1 longitude"),
+    within_pt2_latitude: float = Query(..., alias="within-pt2-lat", description="Rectangle: pt2 latitude"),
+    within_pt2_longitude: float = Query(..., alias="within-pt2-lon", description="Rectangle: pt2 longitude"),
+    keys: List[StationKey] = Query(station_key_defaults, description="List of keys to return for the stations"),
+    is_highest_duplicates_rating: bool = Query(
+        None,
+        alias="is-highest-duplicates-rating",
+        description="Use only stations with the highest duplicates rating (filter stations at the same place)",
+    ),
+):
+    if not 0 <= zoom <= max_tile_zoom:
+        raise HTTPException(status_code=400, detail=f"zoom is out of bounds (>=0,<={max_tile_zoom}), zoom: {zoom}")
+    check_latitude_longitude(within_pt1_latitude, within_pt1_longitude)
+    check_latitude_longitude(within_pt2_latitude, within_pt2_longitude)
+
+    projection_dict = {}
+    for key in keys:
+        projection_dict[key.value] = 1
+    # last._id should be always returned
+    projection_dict["last._id"] = 1
+
+    now = datetime.now().timestamp()
+    query = {"status": {"$ne": "hidden"}, "last._id": {"$gt": now - 30 * 24 * 3600}}
+    if is_highest_duplicates_rating:
+        query["duplicates.is_highest_rating"] = {"$ne": False}
+    sw = (within_pt2_longitude, within_pt2_latitude)
+    ne = (within_pt1_longitude, within_pt1_latitude)
+
+    mask = stations_index.mask(query) if stations_index.ready else None
+    if mask is not None:
+        mask &= stations_index.within(sw, ne)
+        ids = stations_index.ids[mask]
+        lon = stations_index.lon[mask]
+        lat = stations_index.lat[mask]
+        w_avg = stations_index.columns["last.w-avg"][mask]
+        w_max = stations_index.columns["last.w-max"][mask]
+    else:
+        query["loc"] = {"$geoWithin": {"$geometry": generate_box_geometry(sw, ne)}}
+        cursor = mongodb.stations.find(query, {"loc": 1, "last.w-avg": 1, "last.w-max": 1})
+        stations = await cursor.to_list(None)
+        ids = np.array([station["_id"] for station in stations], dtype=object)
+        lon = [station["loc"]["coordinates"][0] for station in stations]
+        lat = [station["loc"]["coordinates"][1] for station in stations]
+        w_avg = [get_value(station, "last.w-avg") for station in stations]
+        w_max = [get_value(station, "last.w-max") for station in stations]
+    if not len(ids):
+        return response([])
+
+    markers = cluster_markers(lon, lat, np.array(w_avg, dtype=float), np.array(w_max, dtype=float), zoom)
+    representative_ids = list(ids[markers["representative"]])
+    if stations_snapshot.ready:
+        stations = stations_snapshot.find({"_id": {"$in": representative_ids}}, projection_dict)
+    else:
+        stations = await mongodb.stations.find({"_id": {"$in": representative_ids}}, projection_dict).to_list(None)
+    stations = {station["_id"]: station for station in stations}
+
+    def to_float(value):
+        return None if np.isnan(value) else float(value)
+
+    clusters = []
+    for i, station_id in enumerate(representative_ids):
+        if station_id not in stations:
+            continue
+        clusters.append(
+            {
+                "loc": {"type": "Point", "coordinates": [float(markers["lon"][i]), float(markers["lat"][i])]},
+                "count": int(markers["count"][i]),
+                "w-avg": to_float(markers["w-avg"][i]),
+                "w-max": to_float(markers["w-max"][i]),
+                "station": stations[station_id],
+            }
+        )
+    return response(clusters)
+
+
+async def query_stations(
+    mongodb,
+    projection_dict: dict,
+    request_limit: int = 20,
+    provider: str = None,
+    search: str = None,
+    search_language: str = None,
+    near_latitude: float = None,
+    near_longitude: float = None,
+    near_distance: int = None,
+    within_pt1_latitude: float = None,
+    within_pt1_longitude: float = None,
+    within_pt2_latitude: float = None,
+    within_pt2_longitude: float = None,
+    is_peak: bool = None,
+    status: Status = None,
+    last_measure: Union[int, datetime] = None,
+    is_highest_duplicates_rating: bool = None,
+    ids: List[str] = None,
+    accept_language: str = None,
+):
+    """
+    Returns the stations matching the find_stations parameters: a list, or a cursor when the results aren't loaded in
+    memory.
+    """
+    if 1 <= request_limit <= 500:
+        limit = request_limit
+    else:
+        limit = 500
+    use_limit = True
+
+    now = datetime.now().timestamp()
+    query = {"status": {"$ne": "hidden"}, "last._id": {"$gt": now - 30 * 24 * 3600}}
+    search_ranks = None
+
+    if provider:
+        use_limit = False
+        query["pv-code"] = provider
+
+    if search:
+        use_limit = True
+        if not search_language:
+            search_language = negotiate_language(accept_language, default="en")
+        words = remove_stop_words(search.split(), search_language)
+
+        if words and search_index.ready:
+            search_ranks = {station_id: rank for rank, station_id in enumerate(search_index.search(words))}
+            query["_id"] = {"$in": list(search_ranks)}
+        elif words:
+            or_queries = []
+            for word in words:
+                regexp_query = diacritics.create_regexp(diacritics.normalize(word))
+                or_queries.append({"name": {"$regex": regexp_query, "$options": "i"}})
+                or_queries.append({"short": {"$regex": regexp_query, "$options": "i"}})
+            query["$or"] = or_queries
+
+    if is_peak is not None:
+        query["peak"] = {"$eq": is_peak}
+
+    if status is not None:
+        query["status"] = {"$eq": status}
+
+    if last_measure is not None:
+        timestamp = None
+        if isinstance(last_measure, int):
+            timestamp = now - last_measure
+        elif isinstance(last_measure, datetime):
+            timestamp = last_measure.timestamp()
+        if timestamp:
+            query["last._id"] = {"$gte": int(timestamp)}
+
+    if is_highest_duplicates_rating:
+        # Return stations with "duplicates.is_highest_rating" that exists and is True
+        # https://www.mongodb.com/docs/v4.4/tutorial/query-for-null-fields/#non-equality-filter
+        query["duplicates.is_highest_rating"] = {"$ne": False}
+
+    if near_latitude and near_longitude:
+        check_latitude_longitude(near_latitude, near_longitude)
+        index_mask = stations_index.mask(query) if stations_index.ready else None
+        if index_mask is not None:
+            ids = stations_index.nearest(near_longitude, near_latitude, index_mask, limit, near_distance or None)
+            # The query is applied again: the stations may have changed since the index was refreshed
+            query = {**query, "_id": {"$in": ids}}
+            if stations_snapshot.ready:
+                stations = stations_snapshot.find(query, projection_dict)
+            else:
+                stations = await mongodb.stations.find(query, projection_dict).to_list(None)
+                positions = {station_id: position for position, station_id in enumerate(ids)}
+                stations.sort(key=lambda station: positions[station["_id"]])
+            return stations
+
+        if near_distance:
+            query["loc"] = {
+                "$near": {
+                    "$geometry": {"type": "Point", "coordinates": [near_longitude, near_latitude]},
+                    "$maxDistance": near_distance,
+                }
+            }
+        else:
+            query["loc"] = {"$near": {"$geometry": {"type": "Point", "coordinates": [near_longitude, near_latitude]}}}
+        # $near results are already sorted: return now
+        return mongodb.stations.find(query, projection_dict).limit(limit)
+
+    if (
+        within_pt1_latitude is not None
+        and within_pt1_longitude is not None
+        and within_pt2_latitude is not None
+        and within_pt2_longitude is not None
+    ):
+        check_latitude_longitude(within_pt1_latitude, within_pt1_longitude)
+        check_latitude_longitude(within_pt2_latitude, within_pt2_longitude)
+        if within_pt1_latitude == within_pt2_latitude and within_pt1_longitude == within_pt2_longitude:
+            # Empty box
+            return []
+
+        sw = (within_pt2_longitude, within_pt2_latitude)
+        ne = (within_pt1_longitude, within_pt1_latitude)
+        return await find_box_stations(mongodb, query, sw, ne, limit, projection_dict)
+
+    if ids:
+        if search_ranks is not None:
+            ids = [station_id for station_id in ids if station_id in search_ranks]
+        query["_id"] = {"$in": ids}
+        if stations_snapshot.ready and "$or" not in query:
+            stations = stations_snapshot.find(query, projection_dict)
+        else:
+            cursor = mongodb.stations.find(query, projection_dict)
+            stations = await cursor.to_list(None)
+        stations.sort(key=lambda station: ids.index(station["_id"]))
+        return stations
+
+    if use_limit:
+        cursor_limit = limit
+    elif request_limit >= 1:
+        cursor_limit = request_limit
+    else:
+        cursor_limit = None
+    if search_ranks is not None:
+        # Stations ordered by search rank
+        if stations_snapshot.ready:
+            stations = stations_snapshot.find(query, projection_dict, limit=cursor_limit)
+        else:
+            # Only the ids of the matching stations are fetched to select the best ranked ones
+            matches = await mongodb.stations.find(query, {"_id": 1}).to_list(None)
+            ranked_ids = sorted((station["_id"] for station in matches), key=search_ranks.get)[:cursor_limit]
+            stations = await mongodb.stations.find({"_id": {"$in": ranked_ids}}, projection_dict).to_list(None)
+            stations.sort(key=lambda station: search_ranks[station["_id"]])
+        return stations[:cursor_limit]
+    if stations_snapshot.ready and "$or" not in query:
+        return stations_snapshot.find(query, projection_dict, sort="short", limit=cursor_limit)
+    cursor = mongodb.stations.find(query, projection_dict).sort("short", pymongo.ASCENDING)
+    if cursor_limit:
+        cursor.limit(cursor_limit)
+    return cursor
+
+
 @router.get(
     "/stations/{station_id}/",
     status_code=200,
@@ -74,6 +628,8 @@ Example:
     responses={404: {"description": "Station not found", "content": {**error_detail_doc}}},
 )
 async def get_station(
+    request: Request,
+    http_response: Response,
     mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
     station_id: str = Path(..., description="The station ID to request"),
     keys: List[StationKey] = Query(station_key_defaults, description="List of keys to return"),
@@ -84,10 +640,18 @@ async def get_station(
     # last._id should be always returned
     projection_dict["last._id"] = 1
 
-    station = await mongodb.stations.find_one({"_id": station_id}, projection_dict)
+    if stations_snapshot.ready:
+        station = stations_snapshot.get(station_id, projection_dict)
+    else:
+        station = await mongodb.stations.find_one({"_id": station_id}, projection_dict)
     if not station:
         raise HTTPException(status_code=404, detail=f"No station with id '{station_id}'")
-    return response(station)
+    headers = None
+    if "last" in station:
+        headers = check_conditional_request(request, station["last"]["_id"])
+        # Used by FastAPI when the response is validated
+        http_response.headers.update(headers)
+    return response(station, headers=headers)
 
 
 @router.get(
@@ -154,149 +718,151 @@ async def find_stations(
         description="Return only stations with the highest duplicates rating (filter stations at the same place)",
     ),
     ids: List[str] = Query(None, description="Returns stations by ids"),
+    format: Format = format_query,
     accept_language: str = Header(None),
 ):
-    if 1 <= request_limit <= 500:
-        limit = request_limit
-    else:
-        limit = 500
-    use_limit = True
-
     projection_dict = {}
     for key in keys:
         projection_dict[key.value] = 1
     # last._id should be always returned
     projection_dict["last._id"] = 1
+    paths = ["_id", *projection_dict]
+
+    stations = await query_stations(
+        mongodb,
+        projection_dict,
+        request_limit,
+        provider,
+        search,
+        search_language,
+        near_latitude,
+        near_longitude,
+        near_distance,
+        within_pt1_latitude,
+        within_pt1_longitude,
+        within_pt2_latitude,
+        within_pt2_longitude,
+        is_peak,
+        status,
+        last_measure,
+        is_highest_duplicates_rating,
+        ids,
+        accept_language,
+    )
+    if isinstance(stations, list):
+        return response(stations, format, paths)
+    return await cursor_response(stations, format, paths)
+
+
+@router.post(
+    "/stations/batch/",
+    status_code=200,
+    response_model=List[List[Station]],
+    summary="Run several stations searches",
+    response_class=ORJSONResponse,
+    description=f"""
+Runs up to {max_batch_queries} searches with the parameters of `stations/` and returns their results in the same order.
+The stations are returned with the keys of each search.
 
-    now = datetime.now().timestamp()
-    query = {"status": {"$ne": "hidden"}, "last._id": {"$gt": now - 30 * 24 * 3600}}
-
-    if provider:
-        use_limit = False
-        query["pv-code"] = provider
-
-    if search:
-        use_limit = True
-        if not search_language:
-            search_language = negotiate_language(accept_language, default="en")
-        try:
-            stop_words = get_stop_words(search_language)
-        except StopWordError:
-            stop_words = get_stop_words("en")
-
-        or_queries = []
-        for word in search.split():
-            if word not in stop_words:
-                regexp_query = diacritics.create_regexp(diacritics.normalize(word))
-                or_queries.append({"name": {"$regex": regexp_query, "$options": "i"}})
-                or_queries.append({"short": {"$regex": regexp_query, "$options": "i"}})
-
-        if or_queries:
-            query["$or"] = or_queries
-
-    if is_peak is not None:
-        query["peak"] = {"$eq": is_peak}
-
-    if status is not None:
-        query["status"] = {"$eq": status}
-
-    if last_measure is not None:
-        timestamp = None
-        if isinstance(last_measure, int):
-            timestamp = now - last_measure
-        elif isinstance(last_measure, datetime):
-            timestamp = last_measure.timestamp()
-        if timestamp:
-            query["last._id"] = {"$gte": int(timestamp)}
-
-    if is_highest_duplicates_rating:
-        # Return stations with "duplicates.is_highest_rating" that exists and is True
-        # https://www.mongodb.com/docs/v4.4/tutorial/query-for-null-fields/#non-equality-filter
-        query["duplicates.is_highest_rating"] = {"$ne": False}
+Example body: `[{{"near-lat": 46.78, "near-lon": 6.63, "limit": 3}}, {{"provider": "holfuy"}}, {{"ids": ["holfuy-1636"]}}]`
+""",  # noqa: E501
+    responses={400: {"description": "Bad request", "content": {**error_detail_doc}}},
+)
+async def find_stations_batch(
+    mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
+    queries: List[StationsQuery] = Body(..., description="List of searches"),
+    accept_language: str = Header(None),
+):
+    if not 1 <= len(queries) <= max_batch_queries:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {max_batch_queries} searches are allowed")
 
-    if near_latitude and near_longitude:
-        check_latitude_longitude(near_latitude, near_longitude)
-        if near_distance:
-            query["loc"] = {
-                "$near": {
-                    "$geometry": {"type": "Point", "coordinates": [near_longitude, near_latitude]},
-                    "$maxDistance": near_distance,
-                }
-            }
-        else:
-            query["loc"] = {"$near": {"$geometry": {"type": "Point", "coordinates": [near_longitude, near_latitude]}}}
-        # $near results are already sorted: return now
-        cursor = mongodb.stations.find(query, projection_dict).limit(limit)
-        return response(await cursor.to_list(None))
+    # The keys are applied when the stations are fetched: searches that only differ by their keys are run once
+    query_keys = [query.model_dump_json(exclude={"keys"}) for query in queries]
+    unique_queries = dict(zip(query_keys, queries))
 
-    if (
-        within_pt1_latitude is not None
-        and within_pt1_longitude is not None
-        and within_pt2_latitude is not None
-        and within_pt2_longitude is not None
-    ):
-        check_latitude_longitude(within_pt1_latitude, within_pt1_longitude)
-        check_latitude_longitude(within_pt2_latitude, within_pt2_longitude)
-        if within_pt1_latitude == within_pt2_latitude and within_pt1_longitude == within_pt2_longitude:
-            # Empty box
-            return response([])
+    async def find_ids(query: StationsQuery):
+        params = query.model_dump(exclude={"keys", "limit"})
+        stations = await query_stations(mongodb, {"_id": 1}, query.limit, **params, accept_language=accept_language)
+        if not isinstance(stations, list):
+            stations = await stations.to_list(None)
+        return [station["_id"] for station in stations]
 
-        query["loc"] = {
-            "$geoWithin": {
-                "$geometry": generate_box_geometry(
-                    (within_pt2_longitude, within_pt2_latitude), (within_pt1_longitude, within_pt1_latitude)
-                )
-            }
-        }
+    results = await asyncio.gather(*(find_ids(query) for query in unique_queries.values()))
+    ids_by_query = dict(zip(unique_queries, results))
 
-        def get_cluster_query(cluster: int):
-            return {**query, "clusters": {"$elemMatch": {"$lte": cluster}}}
+    # Fetch each station once with the keys of all the searches
+    projection_dict = {key.value: 1 for query in queries for key in query.keys}
+    projection_dict["last._id"] = 1
+    station_ids = list({station_id for ids in results for station_id in ids})
+    if stations_snapshot.ready:
+        stations = stations_snapshot.find({"_id": {"$in": station_ids}}, projection_dict)
+    else:
+        stations = await mongodb.stations.find({"_id": {"$in": station_ids}}, projection_dict).to_list(None)
+    stations_by_id = {station["_id"]: station for station in stations}
+
+    data = []
+    for query, query_key in zip(queries, query_keys):
+        query_projection = {key.value: 1 for key in query.keys}
+        query_projection["last._id"] = 1
+        data.append(
+            [
+                project(stations_by_id[station_id], query_projection)
+                for station_id in ids_by_query[query_key]
+                if station_id in stations_by_id
+            ]
+        )
+    return response(data)
 
-        save_cluster = await get_save_clusters(mongodb)
-        cluster_min = save_cluster["min"]
-        cluster_max = save_cluster["max"]
-        x = [x for x in np.linspace(cluster_min, cluster_max, 3)]
-        y = [await mongodb.stations.count_documents(get_cluster_query(int(cluster))) for cluster in x]
-        result = linregress(x, y)
-        cluster_value = (limit - result.intercept) / result.slope
-        cluster_value = max(cluster_value, cluster_min)
-        if cluster_value <= cluster_max:
-            cluster = int(cluster_value)
-        else:
-            cluster = None
 
-        if cluster:
-            cursor = mongodb.stations.find(get_cluster_query(cluster), projection_dict)
-        else:
-            cursor = mongodb.stations.find(query, projection_dict)
-        stations = await cursor.to_list(None)
-        return response(stations)
+@router.get(
+    "/stations/tiles/{z}/{x}/{y}/",
+    status_code=200,
+    response_model=List[Station],
+    summary="Get the stations of a map tile",
+    response_class=ORJSONResponse,
+    description=f"""
+Returns the stations within a [web mercator tile](https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames), thinned
+to about {settings.tile_stations} stations. Responses are cached for {settings.tile_cache_ttl} seconds.
 
-    if ids:
-        query["_id"] = {"$in": ids}
-        cursor = mongodb.stations.find(query, projection_dict)
-        stations = await cursor.to_list(None)
-        stations.sort(key=lambda station: ids.index(station["_id"]))
-        return response(stations)
+Example:
+- Tile of the Jura mountains: [stations/tiles/8/132/90/](stations/tiles/8/132/90/)
+""",  # noqa: E501
+    responses={400: {"description": "Bad request", "content": {**error_detail_doc}}},
+)
+async def get_tile(
+    mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
+    z: int = Path(..., description=f"Zoom level (max={max_tile_zoom})"),
+    x: int = Path(..., description="Tile x"),
+    y: int = Path(..., description="Tile y"),
+    keys: List[StationKey] = Query(station_key_defaults, description="List of keys to return"),
+    format: Format = format_query,
+):
+    if not 0 <= z <= max_tile_zoom:
+        raise HTTPException(status_code=400, detail=f"z is out of bounds (>=0,<={max_tile_zoom}), z: {z}")
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(status_code=400, detail=f"x or y is out of bounds (>=0,<{2**z}), x: {x}, y: {y}")
 
-    cursor = mongodb.stations.find(query, projection_dict).sort("short", pymongo.ASCENDING)
-    if use_limit:
-        cursor.limit(limit)
-    elif request_limit >= 1:
-        cursor.limit(request_limit)
-    return response(await cursor.to_list(None))
+    keys = sorted(key.value for key in keys)
+    stations = await get_tile_stations(mongodb, z, x, y, keys)
+    headers = {"Cache-Control": f"public, max-age={settings.tile_cache_ttl}"}
+    return response(stations, format, ["_id", *keys, "last._id"], headers)
 
 
 @router.get(
     "/stations/{station_id}/historic/",
     status_code=200,
-    response_model=List[Measure],
+    response_model=Union[List[Measure], List[MeasureAggregate]],
     summary="Get historic data for a station since a duration",
     response_class=ORJSONResponse,
     description="""
 Example:
 
 - Historic Le Suchet (1 hour): [stations/holfuy-1636/historic/?duration=3600](stations/holfuy-1636/historic/?duration=3600)
+- Historic Le Suchet (1 day) aggregated in about 300 points: [stations/holfuy-1636/historic/?duration=86400&points=300](stations/holfuy-1636/historic/?duration=86400&points=300)
+- Measures of Le Suchet more recent than a timestamp: [stations/holfuy-1636/historic/?since=1565722207](stations/holfuy-1636/historic/?since=1565722207)
+- Historic Le Suchet (90 days) aggregated by day: [stations/holfuy-1636/historic/?duration=7776000&bucket=86400](stations/holfuy-1636/historic/?duration=7776000&bucket=86400)
+
+Durations above 7 days are answered from hourly (up to 31 days) or daily rollups, with buckets of at least 1 hour.
 """,  # noqa: E501
     responses={
         400: {"description": "Bad request", "content": {**error_detail_doc}},
@@ -304,27 +870,136 @@ Example:
     },
 )
 async def get_station_historic(
+    request: Request,
+    http_response: Response,
     mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
     station_id: str = Path(..., description="The station ID to request"),
     duration: int = Query(3600, description="Historic duration"),
     keys: List[MeasureKey] = Query(measure_key_defaults, description="List of keys to return"),
+    bucket: int = Query(
+        None, description="Aggregate the measures by intervals of {bucket} seconds: min/max/avg of the values"
+    ),
+    points: int = Query(None, description="Aggregate the measures in about {points} intervals"),
+    since: int = Query(
+        None, description="Return only the measures more recent than {since} [unix timestamp], within the duration"
+    ),
+    until: int = Query(
+        None, description="Return only the measures older than {until} [unix timestamp], the duration ends at {until}"
+    ),
+    limit: int = Query(
+        None,
+        description="Nb measures to return. When more measures are available, the 'X-Next-Until' header contains "
+        "the {until} value of the next page",
+    ),
+    format: Format = format_query,
 ):
-    projection_dict = {}
-    for key in keys:
-        projection_dict[key.value] = 1
-
-    if duration > 7 * 24 * 3600:
-        raise HTTPException(status_code=400, detail="Duration > 7 days")
+    rollup = None
+    if duration > max_historic_duration:
+        bucket = get_historic_bucket(duration, bucket, points, max_rollup_duration)
+        rollup = get_resolution(duration, bucket)
+        if rollup is None:
+            raise HTTPException(status_code=400, detail=f"Bucket < {min(resolutions.values())} for durations > 7 days")
+        rollup_name, rollup_resolution = rollup
+        # Each rollup document must fall in a single interval
+        bucket = math.ceil((bucket or rollup_resolution) / rollup_resolution) * rollup_resolution
+    else:
+        bucket = get_historic_bucket(duration, bucket, points)
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="Limit < 1")
 
-    station = await mongodb.stations.find_one({"_id": station_id})
+    if stations_snapshot.ready:
+        station = stations_snapshot.get(station_id, {"last._id": 1})
+    else:
+        station = await mongodb.stations.find_one({"_id": station_id}, {"last._id": 1})
     if not station:
         raise HTTPException(status_code=404, detail=f"No station with id '{station_id}'")
 
-    if "last" not in station or station_id not in await get_collection_names(
-        mongodb=mongodb, aiocache_wait_for_write=False
-    ):
+    collection_names = await get_collection_names(mongodb)
+    if "last" not in station or station_id not in collection_names:
         raise HTTPException(status_code=404, detail=f"No historic data for station id '{station_id}'")
+    if rollup and rollup_collection(station_id, rollup_name) not in collection_names:
+        raise HTTPException(status_code=404, detail=f"No rollups for station id '{station_id}': duration > 7 days")
     last_time = station["last"]["_id"]
-    start_time = last_time - duration
-    cursor = mongodb[station_id].find({"_id": {"$gte": start_time}}, projection_dict, sort=(("_id", -1),))
-    return response(await cursor.to_list(None))
+    headers = check_conditional_request(request, last_time)
+    # Used by FastAPI when the response is validated
+    http_response.headers.update(headers)
+
+    # Pages walking back with {until} get the same duration as the first one
+    start_time = (last_time if until is None else until) - duration
+    if since is not None and since < start_time:
+        raise HTTPException(status_code=400, detail=f"Since < {start_time}: out of the duration")
+    query = {"_id": {"$gte": start_time}}
+    if since is not None:
+        query["_id"]["$gt"] = since
+    if until is not None:
+        query["_id"]["$lt"] = until
+    if rollup:
+        collection = rollup_collection(station_id, rollup_name)
+        cursor = get_rollup_cursor(mongodb, collection, rollup_resolution, query, keys, bucket, limit)
+    else:
+        cursor = get_historic_cursor(mongodb, station_id, query, keys, bucket, limit)
+    paths = aggregate_paths(keys) if bucket else [key.value for key in keys]
+    if not limit:
+        return await cursor_response(cursor, format, paths, headers)
+
+    measures = await cursor.to_list(None)
+    if len(measures) == limit:
+        headers["X-Next-Until"] = str(measures[-1]["_id"])
+        http_response.headers["X-Next-Until"] = headers["X-Next-Until"]
+    return response(measures, format, paths, headers)
+
+
+@router.get(
+    "/stations/{station_id}/stats/",
+    status_code=200,
+    response_model=WindStats,
+    summary="Get wind statistics of a station",
+    response_class=ORJSONResponse,
+    description="""
+Wind rose, percentiles of the wind speeds, gust factor and mean wind direction of the measures since a duration.
+
+Example:
+- Wind statistics of Le Suchet (1 day): [stations/holfuy-1636/stats/?duration=86400](stations/holfuy-1636/stats/?duration=86400)
+- Wind rose with 8 sectors of Le Suchet (7 days): [stations/holfuy-1636/stats/?duration=604800&sectors=8](stations/holfuy-1636/stats/?duration=604800&sectors=8)
+""",  # noqa: E501
+    responses={
+        400: {"description": "Bad request", "content": {**error_detail_doc}},
+        404: {"description": "Station not found", "content": {**error_detail_doc}},
+    },
+)
+async def get_station_stats(
+    request: Request,
+    http_response: Response,
+    mongodb: Annotated[AsyncIOMotorDatabase, Depends(mongodb)],
+    station_id: str = Path(..., description="The station ID to request"),
+    duration: int = Query(24 * 3600, description="Duration of the window"),
+    sectors: int = Query(16, description="Number of direction sectors of the wind rose (4-36)"),
+    percentiles: List[float] = Query([10, 50, 90], description="Percentiles of the wind speeds (0-100)"),
+):
+    if duration < 1:
+        raise HTTPException(status_code=400, detail="Duration < 1")
+    if duration > max_historic_duration:
+        raise HTTPException(status_code=400, detail=f"Duration > {max_historic_duration // (24 * 3600)} days")
+    if not 4 <= sectors <= 36:
+        raise HTTPException(status_code=400, detail="Sectors must be between 4 and 36")
+    if len(percentiles) > max_stats_percentiles or not all(0 <= percentile <= 100 for percentile in percentiles):
+        raise HTTPException(
+            status_code=400, detail=f"Up to {max_stats_percentiles} percentiles between 0 and 100 are allowed"
+        )
+
+    if stations_snapshot.ready:
+        station = stations_snapshot.get(station_id, {"last._id": 1})
+    else:
+        station = await mongodb.stations.find_one({"_id": station_id}, {"last._id": 1})
+    if not station:
+        raise HTTPException(status_code=404, detail=f"No station with id '{station_id}'")
+    collection_names = await get_collection_names(mongodb)
+    if "last" not in station or station_id not in collection_names:
+        raise HTTPException(status_code=404, detail=f"No historic data for station id '{station_id}'")
+    last_time = station["last"]["_id"]
+    headers = check_conditional_request(request, last_time)
+    # Used by FastAPI when the response is validated
+    http_response.headers.update(headers)
+
+    stats = await get_wind_stats(mongodb, station_id, last_time, duration, sectors, percentiles)
+    return response(stats, headers=headers)
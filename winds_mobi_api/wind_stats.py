@@ -0,0 +1,92 @@
+import numpy as np
+
+# Lower bound of the speed classes of the wind rose [km/h]
+speed_classes = [0, 10, 20, 30, 40, 50]
+# Wind directions of slower measures are not meaningful
+calm_speed = 1
+# Gust factors are computed on measures with enough wind
+gust_min_speed = 5
+
+
+def to_float(value, digits=2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def circular_mean(w_dir, weights):
+    """
+    Returns the mean direction [°] of the vectors and the length of their mean (0: variable, 1: constant direction).
+    """
+    if not np.any(weights):
+        return np.nan, np.nan
+    radians = np.radians(w_dir)
+    x = np.average(np.cos(radians), weights=weights)
+    y = np.average(np.sin(radians), weights=weights)
+    return np.degrees(np.arctan2(y, x)) % 360, np.hypot(x, y)
+
+
+def percentiles(values, q):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {f"p{p:g}": None for p in q}
+    return {f"p{p:g}": to_float(value) for p, value in zip(q, np.percentile(values, q))}
+
+
+def wind_rose(w_dir, w_avg, sectors):
+    """
+    Counts the measures by direction sector (centered on the north for the first one) and speed class.
+    """
+    width = 360 / sectors
+    sector = (np.floor(((w_dir + width / 2) % 360) / width).astype(np.int64)) % sectors
+    speed_class = np.digitize(w_avg, speed_classes[1:])
+    counts = np.zeros((sectors, len(speed_classes)), dtype=np.int64)
+    np.add.at(counts, (sector, speed_class), 1)
+    sector_speeds = np.bincount(sector, weights=w_avg, minlength=sectors)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sector_speeds = sector_speeds / counts.sum(axis=1)
+    return counts, sector_speeds
+
+
+def wind_stats(w_dir, w_avg, w_max, sectors, q):
+    """
+    Wind statistics of the measures: missing values are NaN.
+    """
+    w_dir = np.asarray(w_dir, dtype=float)
+    w_avg = np.asarray(w_avg, dtype=float)
+    w_max = np.asarray(w_max, dtype=float)
+
+    valid = ~np.isnan(w_dir) & ~np.isnan(w_avg)
+    windy = valid & (w_avg >= calm_speed)
+    total = np.count_nonzero(valid)
+    counts, sector_speeds = wind_rose(w_dir[windy], w_avg[windy], sectors)
+    # Wind run: the directions are weighted by the wind speed
+    direction, consistency = circular_mean(w_dir[windy], w_avg[windy])
+
+    gusts = ~np.isnan(w_max) & ~np.isnan(w_avg) & (w_avg >= gust_min_speed)
+    gust_factor = np.mean(w_max[gusts] / w_avg[gusts]) if np.any(gusts) else np.nan
+
+    frequencies = counts / total if total else np.zeros(counts.shape)
+    sector_dirs = np.arange(sectors) * 360 / sectors
+    return {
+        "count": int(len(w_avg)),
+        "w-dir": to_float(np.round(direction, 2) % 360),
+        "w-dir-consistency": to_float(consistency),
+        "w-avg": percentiles(w_avg, q),
+        "w-max": percentiles(w_max, q),
+        "gust-factor": to_float(gust_factor),
+        "calm": to_float(np.count_nonzero(valid & ~windy) / total, 4) if total else None,
+        "speed-classes": speed_classes,
+        "wind-rose": [
+            {
+                "dir": to_float(sector_dir),
+                "frequency": to_float(frequency, 4),
+                "w-avg": to_float(speed),
+                "speeds": speeds,
+            }
+            for sector_dir, frequency, speed, speeds in zip(
+                sector_dirs,
+                frequencies.sum(axis=1),
+                sector_speeds,
+                np.round(frequencies, 4).tolist(),
+            )
+        ],
+    }